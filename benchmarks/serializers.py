@@ -0,0 +1,77 @@
+"""
+from_orm + response_model (как отвечал CRUDRouter раньше) против compile_serializer + DefaultJSONResponse.
+Объекты - простые namespace вместо записей ORM, чтобы мерить только сериализацию.
+Нужен settings.py проекта в PYTHONPATH (как для любого импорта ex_fastapi):
+
+    PYTHONPATH=path/to/project python benchmarks/serializers.py [rows] [repeat]
+"""
+import asyncio
+import sys
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from ex_fastapi import CamelModelORM
+from ex_fastapi.default_response import DefaultJSONResponse
+from ex_fastapi.pydantic import compile_serializer, RelatedList
+
+
+class TagRead(CamelModelORM):
+    id: int
+    name: str
+
+
+class ArticleRead(CamelModelORM):
+    id: int
+    title: str
+    slug: str
+    rating: float
+    is_published: bool
+    author_id: Optional[int]
+    created_at: datetime
+    tags: RelatedList[TagRead]
+
+
+def make_rows(count: int) -> list[SimpleNamespace]:
+    now = datetime.now()
+    return [
+        SimpleNamespace(
+            id=i, title=f'Article {i}', slug=f'article-{i}', rating=i / 7, is_published=bool(i % 2),
+            author_id=i % 10 or None, created_at=now,
+            tags=[SimpleNamespace(id=j, name=f'tag {j}') for j in range(3)],
+        )
+        for i in range(count)
+    ]
+
+
+def main(rows_count: int = 100, repeat: int = 200) -> None:
+    rows = make_rows(rows_count)
+    field = create_response_field(name='Response', type_=list[ArticleRead])
+    serialize = compile_serializer(ArticleRead)
+    loop = asyncio.new_event_loop()
+
+    def from_orm():
+        content = loop.run_until_complete(serialize_response(
+            field=field, response_content=[ArticleRead.from_orm(r) for r in rows], is_coroutine=True,
+        ))
+        return DefaultJSONResponse(content).body
+
+    def precompiled():
+        return DefaultJSONResponse([serialize(r) for r in rows]).body
+
+    assert from_orm() == precompiled()
+    results = {name: min(timeit.repeat(func, number=repeat, repeat=3)) / repeat for name, func in (
+        ('from_orm', from_orm),
+        ('precompiled', precompiled),
+    )}
+    for name, seconds in results.items():
+        print(f'{name:>12}: {seconds * 1000:.3f} ms / {rows_count} rows')
+    print(f'{"speedup":>12}: x{results["from_orm"] / results["precompiled"]:.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
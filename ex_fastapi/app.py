@@ -2,6 +2,7 @@ from typing import Literal
 
 from fastapi import FastAPI
 
+from .default_response import DefaultJSONResponse
 from .default_validators import \
     default_exception_handlers, \
     change_openapi_validation_error_schema
@@ -16,6 +17,7 @@ class ExFastAPI(FastAPI):
             **kwargs
     ) -> None:
         kwargs.setdefault('swagger_ui_parameters', {"operationsSorter": "method", "docExpansion": "none"})
+        kwargs.setdefault('default_response_class', DefaultJSONResponse)
         exception_handlers = kwargs.get('exception_handlers', {})
         kwargs['exception_handlers'] = {**default_exception_handlers, **exception_handlers}
         super().__init__(**kwargs)
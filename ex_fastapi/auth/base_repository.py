@@ -1,16 +1,17 @@
-from typing import Type, Generic, TypeVar, Protocol, Optional, Literal, TYPE_CHECKING, Any
+from typing import Type, Generic, TypeVar, Protocol, Optional, Literal, TYPE_CHECKING, Any, Self
 from datetime import datetime
 from uuid import UUID
 
-from passlib.context import CryptContext
 from fastapi import BackgroundTasks
 from pydantic import EmailStr
 
+from ex_fastapi.global_objects import get_password_hasher
 from ex_fastapi.pydantic import Username, PhoneNumber
 from ex_fastapi.schemas import PasswordsPair
 
 if TYPE_CHECKING:
     from .config import Token
+    from .password import PasswordHasher
 
 
 class UserInterface(Protocol):
@@ -34,7 +35,6 @@ USER_MODEL = TypeVar("USER_MODEL", bound=UserInterface)
 class BaseUserRepository(Generic[USER_MODEL]):
     model: Type[USER_MODEL]
     user: USER_MODEL
-    pwd_context = CryptContext(schemes=["md5_crypt"])
 
     def __init__(self, user: USER_MODEL):
         self.user = user
@@ -73,20 +73,25 @@ class BaseUserRepository(Generic[USER_MODEL]):
     async def activate(self) -> None:
         raise NotImplementedError
 
-    def set_password(self, password: str) -> None:
+    @property
+    def password_hasher(self) -> "PasswordHasher":
+        return get_password_hasher()
+
+    async def set_password(self, password: str) -> None:
         raise NotImplementedError
 
     def get_fake_password(self, password: str) -> str:
         raise NotImplementedError
 
-    def get_password_hash(self, password: str) -> str:
-        return self.pwd_context.hash(self.get_fake_password(password))
+    async def get_password_hash(self, password: str) -> str:
+        return await self.password_hasher.hash(self.get_fake_password(password))
 
-    def verify_password(self, password: str) -> bool:
+    async def verify_password(self, password: str) -> bool:
+        """Проверяет пароль и пересохраняет хэш, если он сделан устаревшей схемой"""
         raise NotImplementedError
 
-    @property
-    def save(self):
+    async def save(self, **kwargs) -> None:
+        """Сохраняет пользователя и сбрасывает его запись в кэше пользователей (get_user_cache)"""
         raise NotImplementedError
 
     def can_login(self) -> bool:
@@ -101,6 +106,26 @@ class BaseUserRepository(Generic[USER_MODEL]):
     def has_permissions(self, *perms) -> bool:
         raise NotImplementedError
 
+    @property
+    def permissions_mask(self) -> int:
+        """Битовая маска прав пользователя по id прав (см. permission_claims)"""
+        raise NotImplementedError
+
+    @classmethod
+    def get_required_permissions_mask(cls, *perms) -> Optional[int]:
+        """Маска требуемых прав, None если такого права нет совсем"""
+        raise NotImplementedError
+
+    def has_permissions_mask(self, required: Optional[int]) -> bool:
+        raise NotImplementedError
+
+    def dump_cache(self) -> dict[str, Any]:
+        raise NotImplementedError
+
+    @classmethod
+    def load_cache(cls, data: dict[str, Any]) -> Self:
+        raise NotImplementedError
+
     async def update_or_create_temp_code(self) -> None:
         raise NotImplementedError
 
@@ -1,13 +1,23 @@
-from typing import TypedDict, Literal
+from typing import TypedDict, Literal, Any
 from enum import Enum
 
+from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePublicKey
+from cryptography.hazmat.primitives.asymmetric.ed448 import Ed448PublicKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from jwt import PyJWT
+from jwt.algorithms import get_default_algorithms
 
 from ex_fastapi.pydantic import CamelModel
 from ex_fastapi.pydantic.utils import get_schema
 from .schemas import TokenUser
 
 
+# алгоритм JWT по кривой EC ключа
+EC_CURVE_ALGORITHMS = {'secp256r1': 'ES256', 'secp384r1': 'ES384', 'secp521r1': 'ES512'}
+
+
 class TokenTypes(Enum):
     refresh = 'refresh'
     access = 'access'
@@ -17,6 +27,30 @@ class BaseJWTConfig:
     ALGORITHM = "RS256"
     jwt = PyJWT()
 
+    @staticmethod
+    def clean_key(key: str) -> str:
+        return key.replace('|||n|||', '\n').strip("'").strip('"')
+
+    @classmethod
+    def prepare_key(cls, key: str, algorithm: str) -> Any:
+        """PEM -> объект ключа cryptography, разбирается один раз, а не на каждый encode/decode"""
+        return get_default_algorithms()[algorithm].prepare_key(cls.clean_key(key))
+
+    @classmethod
+    def prepare_public_key(cls, key: str) -> tuple[str, Any]:
+        """Для старых ключей при ротации алгоритм определяется по типу ключа"""
+        key = load_pem_public_key(cls.clean_key(key).encode())
+        match key:
+            case RSAPublicKey():
+                return 'RS256', key
+            case EllipticCurvePublicKey():
+                if (algorithm := EC_CURVE_ALGORITHMS.get(key.curve.name)) is None:
+                    raise ValueError(f'Unsupported elliptic curve {key.curve.name}')
+                return algorithm, key
+            case Ed25519PublicKey() | Ed448PublicKey():
+                return 'EdDSA', key
+        raise ValueError(f'Unsupported public key type {type(key).__name__}')
+
 
 class AuthStrategy(TypedDict, total=False):
     method: Literal['cookie', 'header']
@@ -1,10 +1,12 @@
+import time
 from collections.abc import Callable
-from typing import Any
+from typing import Any, Optional
 
 from fastapi import Cookie, Header
-from jwt import InvalidSignatureError, ExpiredSignatureError, DecodeError
+from jwt import InvalidSignatureError, ExpiredSignatureError, DecodeError, get_unverified_header
 
 from ex_fastapi.global_objects import get_auth_errors
+from ex_fastapi.caching import TTLCache
 from .config import BaseJWTConfig, TokenTypes, AuthStrategy, default_auth_strategy, Token, auth_strategy_is_valid
 
 
@@ -12,13 +14,35 @@ AuthErrors = get_auth_errors()
 
 
 class JWTConsumer(BaseJWTConfig):
-    PUBLIC_KEY: str
-
-    def __init__(self, public_key: str):
-        self.PUBLIC_KEY = public_key.strip("'").strip('"')
+    PUBLIC_KEY: Any
+    keys: dict[Optional[str], tuple[str, Any]]
+
+    def __init__(
+            self,
+            public_key: str,
+            algorithm: str = None,
+            kid: str = None,
+            previous_keys: dict[str, str] = None,
+    ):
+        """
+        previous_keys - {kid: PEM} ключей, которыми ещё могут быть подписаны живые токены.
+        Токены без kid проверяются текущим ключом или ключом с kid '' из previous_keys
+        """
+        self.ALGORITHM = algorithm or self.ALGORITHM
+        self.PUBLIC_KEY = self.prepare_key(public_key, self.ALGORITHM)
+        self.keys = {
+            kid or None: self.prepare_public_key(key)
+            for kid, key in (previous_keys or {}).items()
+        }
+        self.keys[kid] = (self.ALGORITHM, self.PUBLIC_KEY)
+        self.keys.setdefault(None, (self.ALGORITHM, self.PUBLIC_KEY))
 
     def decode(self, token: str) -> dict[str, Any]:
-        return self.jwt.decode(token, self.PUBLIC_KEY, [self.ALGORITHM])
+        try:
+            algorithm, key = self.keys[get_unverified_header(token).get('kid')]
+        except (KeyError, TypeError):
+            raise DecodeError('Unknown key id')
+        return self.jwt.decode(token, key, [algorithm])
 
 
 class AuthConsumer:
@@ -26,22 +50,38 @@ class AuthConsumer:
     jwt: JWTConsumer
     auth_method: str
     auth_schema: str
-
-    def __init__(self, public_key: str, strategy: AuthStrategy):
-        self.jwt = JWTConsumer(public_key)
+    token_cache: Optional[TTLCache[str, Token]]
+
+    def __init__(
+            self,
+            public_key: str,
+            strategy: AuthStrategy,
+            token_cache_size: int = 1024,
+            algorithm: str = None,
+            kid: str = None,
+            previous_keys: dict[str, str] = None,
+    ):
+        self.jwt = JWTConsumer(public_key, algorithm=algorithm, kid=kid, previous_keys=previous_keys)
         strategy: AuthStrategy = {**default_auth_strategy, **strategy}
         assert auth_strategy_is_valid(strategy)
         self.auth_method = strategy['method']
         self.auth_schema = strategy['schema']
+        # проверенные токены до их exp, повторные запросы с тем же токеном не проверяют подпись заново
+        self.token_cache = TTLCache(ttl=0, maxsize=token_cache_size, timer=time.time) if token_cache_size else None
 
     def get_token_payload(self, token: str):
+        if self.token_cache is not None and (cached := self.token_cache.get(token)) is not None:
+            return cached
         try:
             payload = self.jwt.decode(token)
         except (InvalidSignatureError, DecodeError):
             raise AuthErrors.invalid_token.err()
         except ExpiredSignatureError:
             raise AuthErrors.expired_token.err()
-        return Token(**payload)
+        parsed = Token(**payload)
+        if self.token_cache is not None and 'exp' in payload:
+            self.token_cache.set(token, parsed, expires_at=payload['exp'])
+        return parsed
 
     def parse_token(self, token: str, token_type: TokenTypes) -> "Token":
         payload = self.get_token_payload(token)
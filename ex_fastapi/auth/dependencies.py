@@ -1,13 +1,15 @@
-from typing import Type, Literal, TYPE_CHECKING, Sequence
+from typing import Type, Literal, TYPE_CHECKING, Sequence, Optional
 
 from fastapi import Body, Depends, Request
 
-from ex_fastapi.global_objects import get_auth_errors, get_user_repository, get_auth_consumer, get_user_service
+from ex_fastapi.global_objects import get_auth_errors, get_user_repository, get_auth_consumer, get_user_service, \
+    get_user_cache
 from ex_fastapi.routers.exceptions import ItemNotFound
 from ex_fastapi.pydantic.utils import get_schema
 from ex_fastapi.schemas import AuthSchema
 from ex_fastapi.models import BaseModel
 from .config import Token
+from .permission_claims import decode_permissions_mask, mask_has_permissions
 
 if TYPE_CHECKING:
     from .consumer import AuthConsumer
@@ -38,7 +40,7 @@ def get_sign_in_user(
         except ItemNotFound:
             raise AuthErrors.not_authenticated.err()
         user_repo = UserRepository(user)
-        if not user_repo.verify_password(password=auth_data.password):
+        if not await user_repo.verify_password(password=auth_data.password):
             raise AuthErrors.not_authenticated.err()
         return user_repo
 
@@ -51,19 +53,36 @@ async def get_user_by_token(
         select_related: tuple[str, ...],
         prefetch_related: tuple[str, ...],
 ) -> UserRepository:
-    try:
-        user = await get_user_service().get_one(
-            token.user.id,
-            request=request,
-            select_related=select_related,
-            prefetch_related=prefetch_related
-        )
-    except ItemNotFound:
-        raise AuthErrors.not_authenticated.err()
-    user_repo = UserRepository(user)
+    # в кэше только пользователь с правами по умолчанию, с дополнительными связями идём в базу
+    user_cache = get_user_cache() if not select_related and not prefetch_related else None
+    user_repo = await get_cached_user(token) if user_cache is not None else None
+    if user_repo is None:
+        try:
+            user = await get_user_service().get_one(
+                token.user.id,
+                request=request,
+                select_related=select_related,
+                prefetch_related=prefetch_related
+            )
+        except ItemNotFound:
+            raise AuthErrors.not_authenticated.err()
+        user_repo = UserRepository(user)
+        if user_cache is not None:
+            await user_cache.set(token.user.id, user_repo.dump_cache())
+    check_user_by_token(user_repo, token)
+    return user_repo
+
+
+async def get_cached_user(token: "Token") -> Optional[UserRepository]:
+    user_cache = get_user_cache()
+    if user_cache is None or (cached := await user_cache.get(token.user.id)) is None:
+        return None
+    return UserRepository.load_cache(cached)
+
+
+def check_user_by_token(user_repo: UserRepository, token: "Token") -> None:
     if not user_repo.can_login() or user_repo.token_expired(token):
         raise AuthErrors.not_authenticated.err()
-    return user_repo
 
 
 def get_user_by_refresh_token(
@@ -88,25 +107,65 @@ def get_user_by_refresh_token(
     return wrapper
 
 
+async def token_permissions_fresh(token: "Token") -> bool:
+    """
+    Права из токена можно использовать, если после выпуска токена права и пользователи не менялись.
+    Без кэша пользователей (get_user_cache) об изменениях не узнать, поэтому права из токена не используются
+    """
+    user_cache = get_user_cache()
+    if user_cache is None:
+        return False
+    return token.iat > await user_cache.get_permissions_changed_at()
+
+
 def auth_checker(auth_consumer: "AuthConsumer" = None):
     def get_user_with_perms(
             *permissions: tuple[Type[BaseModel], Literal['get', 'create', 'edit', 'delete']],
             select_related: tuple[str, ...] = (),
             prefetch_related: tuple[str, ...] = (),
+            stateless: bool = False,
     ):
+        """
+        stateless=True - если в токене есть права (AuthProvider(permission_claims=True)), они не устарели
+        и пользователь есть в кэше, проверяем права по токену и возвращаем сам токен вместо UserRepository.
+        Активность и смена пароля (can_login, token_expired) проверяются по закэшированному пользователю,
+        иначе - обычная проверка через get_user_by_token
+        """
         get_user_auth = (auth_consumer or get_auth_consumer()).get_user_auth()
+        # маска требуемых прав считается один раз, ContentType заполняется на старте приложения,
+        # поэтому не при создании роутера, а при первом запросе
+        required_mask: list[Optional[int]] = []
+
+        def get_required_mask() -> Optional[int]:
+            if not required_mask:
+                required_mask.append(UserRepository.get_required_permissions_mask(permissions))
+            return required_mask[0]
 
         async def wrapper(
                 request: Request,
                 token: "Token" = Depends(get_user_auth)
         ):
+            if (
+                stateless
+                and token.user.perms is not None
+                and await token_permissions_fresh(token)
+                and (cached_repo := await get_cached_user(token)) is not None
+            ):
+                check_user_by_token(cached_repo, token)
+                if not (
+                    token.user.is_superuser
+                    or (required := get_required_mask()) is not None
+                    and mask_has_permissions(decode_permissions_mask(token.user.perms), required)
+                ):
+                    raise AuthErrors.permission_denied.err()
+                return token
             user_repo = await get_user_by_token(
                 token,
                 request=request,
                 select_related=select_related,
                 prefetch_related=prefetch_related
             )
-            if not (user_repo.is_superuser or user_repo.has_permissions(permissions)):
+            if not (user_repo.is_superuser or user_repo.has_permissions_mask(get_required_mask())):
                 raise AuthErrors.permission_denied.err()
             return user_repo
 
@@ -0,0 +1,42 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Sequence, Callable, TypeVar
+
+from passlib.context import CryptContext
+
+T = TypeVar('T')
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей вне event loop'а, в своём ограниченном пуле потоков.
+    Первая схема из schemes используется для новых хэшей, остальные считаются устаревшими:
+    такие хэши проверяются, а verify_and_update отдаёт новый хэш для пересохранения
+    """
+
+    context: CryptContext
+    executor: Executor
+
+    def __init__(
+            self,
+            schemes: Sequence[str] = ('md5_crypt', ),
+            max_workers: Optional[int] = None,
+            executor: Executor = None,
+            **context_kwargs,
+    ):
+        self.context = CryptContext(schemes=list(schemes), deprecated='auto', **context_kwargs)
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password_hasher')
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self.run(self.context.verify, password, password_hash)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """(пароль верный, новый хэш если старый надо заменить)"""
+        return await self.run(self.context.verify_and_update, password, password_hash)
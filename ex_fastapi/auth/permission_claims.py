@@ -0,0 +1,23 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections.abc import Iterable
+
+
+def permissions_mask(permission_ids: Iterable[int]) -> int:
+    """Битовая маска прав, i-й бит = право с id i"""
+    mask = 0
+    for permission_id in permission_ids:
+        mask |= 1 << permission_id
+    return mask
+
+
+def mask_has_permissions(mask: int, required: int) -> bool:
+    return mask & required == required
+
+
+def encode_permissions_mask(mask: int) -> str:
+    """Маска для токена - little-endian байты в base64url без паддинга"""
+    return urlsafe_b64encode(mask.to_bytes((mask.bit_length() + 7) // 8, 'little')).rstrip(b'=').decode()
+
+
+def decode_permissions_mask(value: str) -> int:
+    return int.from_bytes(urlsafe_b64decode(value + '=' * (-len(value) % 4)), 'little')
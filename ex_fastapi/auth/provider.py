@@ -6,10 +6,12 @@ from pydantic import root_validator
 
 from ex_fastapi.default_response import DefaultJSONEncoder
 from ex_fastapi.settings import get_settings_obj
+from ex_fastapi.global_objects import get_user_repository
 from ex_fastapi.pydantic import CamelModel
 from ex_fastapi.pydantic.utils import get_schema
 from ex_fastapi.schemas import UserMeRead
 from .config import BaseJWTConfig, TokenTypes, AuthStrategy, default_auth_strategy, Token, auth_strategy_is_valid
+from .permission_claims import encode_permissions_mask
 
 
 UserMeRead = get_schema(UserMeRead)
@@ -42,15 +44,20 @@ COOKIE_SECURE = get_settings_obj().cookie_secure
 
 class JWTProvider(BaseJWTConfig):
     lifetime: LIFETIME
-    PRIVATE_KEY: str
+    PRIVATE_KEY: Any
     json_encoder = DefaultJSONEncoder
 
-    def __init__(self, private_key: str, lifetime: LIFETIME = None):
+    def __init__(self, private_key: str, lifetime: LIFETIME = None, algorithm: str = None, kid: str = None):
         self.lifetime = {**lifetime_default, **(lifetime or {})}
-        self.PRIVATE_KEY = private_key.replace('|||n|||', '\n').strip("'").strip('"')
+        self.ALGORITHM = algorithm or self.ALGORITHM
+        self.PRIVATE_KEY = self.prepare_key(private_key, self.ALGORITHM)
+        # kid в заголовке, по нему JWTConsumer выбирает ключ, пока старые токены ещё живы
+        self.headers = {'kid': kid} if kid else None
 
     def encode(self, payload: dict[str, Any]) -> str:
-        return self.jwt.encode(payload, self.PRIVATE_KEY, self.ALGORITHM, json_encoder=self.json_encoder)
+        return self.jwt.encode(
+            payload, self.PRIVATE_KEY, self.ALGORITHM, headers=self.headers, json_encoder=self.json_encoder
+        )
 
 
 class AuthProvider:
@@ -58,27 +65,41 @@ class AuthProvider:
     jwt: JWTProvider
     auth_method: str
     auth_schema: str
-
-    def __init__(self, private_key: str, strategy: AuthStrategy, lifetime: LIFETIME = None):
-        self.jwt = JWTProvider(private_key, lifetime=lifetime)
+    permission_claims: bool
+
+    def __init__(
+            self,
+            private_key: str,
+            strategy: AuthStrategy,
+            lifetime: LIFETIME = None,
+            permission_claims: bool = False,
+            algorithm: str = None,
+            kid: str = None,
+    ):
+        self.jwt = JWTProvider(private_key, lifetime=lifetime, algorithm=algorithm, kid=kid)
         strategy: AuthStrategy = {**default_auth_strategy, **strategy}
         assert auth_strategy_is_valid(strategy)
         self.auth_method = strategy['method']
         self.auth_schema = strategy['schema']
+        # права пользователя кладутся в access токен, user_with_perms сможет проверять их без базы
+        self.permission_claims = permission_claims
 
     @staticmethod
     def now() -> int:
         return int(datetime.now().timestamp())
 
     def create_token(self, user, token_type: TokenTypes, now: int = None) -> str:
-        return self.jwt.encode(
-            TokenIssue(
-                user=user,
-                type=token_type,
-                iat=now or self.now(),
-                lifetime=self.jwt.lifetime
-            ).dict()
+        issue = TokenIssue(
+            user=user,
+            type=token_type,
+            iat=now or self.now(),
+            lifetime=self.jwt.lifetime
         )
+        if self.permission_claims and token_type == TokenTypes.access:
+            user_repo = get_user_repository()(user)
+            # суперпользователю права не нужны, пустая маска только отмечает, что токен их несёт
+            issue.user.perms = '' if user_repo.is_superuser else encode_permissions_mask(user_repo.permissions_mask)
+        return self.jwt.encode(issue.dict(exclude_none=True))
 
     def create_access_token(self, user, now: int = None) -> str:
         return self.create_token(user, TokenTypes.access, now)
@@ -117,3 +117,4 @@ class UserRegistration(PasswordsPair, UserBase):
 class TokenUser(CamelModelORM):
     id: int
     is_superuser: bool
+    perms: Optional[str] = None  # битовая маска прав, см. AuthProvider(permission_claims=True)
@@ -0,0 +1,109 @@
+import json
+import time
+from typing import Any, Optional, Protocol
+
+from ex_fastapi.caching import TTLCache
+
+USER_CACHE_DATA = dict[str, Any]
+
+
+class BaseUserCache:
+    """
+    Кэш пользователя с правами для get_user_by_token.
+    Хранит то, что отдаёт UserRepository.dump_cache, обратно собирается через UserRepository.load_cache
+    """
+
+    async def get(self, user_id: Any) -> Optional[USER_CACHE_DATA]:
+        raise NotImplementedError
+
+    async def set(self, user_id: Any, data: USER_CACHE_DATA) -> None:
+        raise NotImplementedError
+
+    async def invalidate(self, *user_ids: Any) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    async def get_permissions_changed_at(self) -> float:
+        """Время последнего изменения прав, токены выпущенные раньше не годятся для проверки прав без базы"""
+        raise NotImplementedError
+
+    async def touch_permissions_changed_at(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryUserCache(BaseUserCache):
+    """Кэш в памяти процесса, инвалидация видна только этому процессу"""
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        self.cache: TTLCache[Any, USER_CACHE_DATA] = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.permissions_changed_at = 0.0
+
+    async def get(self, user_id: Any) -> Optional[USER_CACHE_DATA]:
+        return self.cache.get(user_id)
+
+    async def set(self, user_id: Any, data: USER_CACHE_DATA) -> None:
+        self.cache.set(user_id, data)
+
+    async def invalidate(self, *user_ids: Any) -> None:
+        for user_id in user_ids:
+            self.cache.pop(user_id)
+
+    async def clear(self) -> None:
+        self.cache.clear()
+
+    async def get_permissions_changed_at(self) -> float:
+        return self.permissions_changed_at
+
+    async def touch_permissions_changed_at(self) -> None:
+        self.permissions_changed_at = time.time()
+
+
+class RedisClient(Protocol):
+    """То, что нужно от клиента, подходит redis.asyncio.Redis и совместимые"""
+
+    async def get(self, name: str) -> Optional[bytes | str]: ...
+
+    async def set(self, name: str, value: str, ex: int = None) -> Any: ...
+
+    async def delete(self, *names: str) -> Any: ...
+
+    def scan_iter(self, match: str = None) -> Any: ...
+
+
+class RedisUserCache(BaseUserCache):
+    """Общий для всех процессов кэш, значения хранятся в json"""
+
+    def __init__(self, redis: RedisClient, ttl: int = 60, prefix: str = 'ex_fastapi:user:'):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def key(self, user_id: Any) -> str:
+        return f'{self.prefix}{user_id}'
+
+    async def get(self, user_id: Any) -> Optional[USER_CACHE_DATA]:
+        value = await self.redis.get(self.key(user_id))
+        if value is None:
+            return None
+        return json.loads(value)
+
+    async def set(self, user_id: Any, data: USER_CACHE_DATA) -> None:
+        await self.redis.set(self.key(user_id), json.dumps(data, default=str), ex=self.ttl)
+
+    async def invalidate(self, *user_ids: Any) -> None:
+        if user_ids:
+            await self.redis.delete(*(self.key(user_id) for user_id in user_ids))
+
+    async def clear(self) -> None:
+        keys = [key async for key in self.redis.scan_iter(match=f'{self.prefix}*')]
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def get_permissions_changed_at(self) -> float:
+        value = await self.redis.get(self.key('__permissions_changed_at__'))
+        return 0.0 if value is None else float(value)
+
+    async def touch_permissions_changed_at(self) -> None:
+        await self.redis.set(self.key('__permissions_changed_at__'), str(time.time()))
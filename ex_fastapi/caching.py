@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar, Optional, Any, Callable
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+_missing: Any = object()
+
+
+class LRUCache(Generic[K, V]):
+    """Ограниченный по размеру кэш, при переполнении выкидывает давно не используемые ключи"""
+
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, Any] = OrderedDict()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        value = self._get(key)
+        if value is _missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def info(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def _get(self, key: K) -> Any:
+        return self._data.get(key, _missing)
+
+    def __contains__(self, key: K) -> bool:
+        return self._get(key) is not _missing
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache[K, V]):
+    """LRUCache, в котором записи живут ttl секунд (или до явно переданного expires_at)"""
+
+    ttl: float
+
+    def __init__(self, ttl: float, maxsize: int = 1000, timer: Callable[[], float] = time.monotonic):
+        super().__init__(maxsize=maxsize)
+        self.ttl = ttl
+        self.timer = timer
+
+    def set(self, key: K, value: V, expires_at: float = None) -> None:
+        super().set(key, (value, self.timer() + self.ttl if expires_at is None else expires_at))
+
+    def _get(self, key: K) -> Any:
+        item = self._data.get(key, _missing)
+        if item is _missing:
+            return _missing
+        value, expires_at = item
+        if expires_at <= self.timer():
+            del self._data[key]
+            return _missing
+        return value
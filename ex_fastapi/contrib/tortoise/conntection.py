@@ -50,6 +50,7 @@ async def check_permissions():
     for ct in content_types:
         ContentType.instances_by_id[ct.id] = ct
         ContentType.instances_by_name[ct.name] = ct
+        ct.permission_ids = {}
 
         model = Tortoise.apps['models'][ct.name]
         need_perm_names: list[str] = ['get', 'create', 'edit', 'delete', *getattr(model, 'ADDITIONAL_PERMS', ())]
@@ -64,3 +65,7 @@ async def check_permissions():
         await Permission.bulk_create(create_perms)
     if delete_perm_ids:
         await Permission.filter(id__in=delete_perm_ids)
+    # bulk_create не во всех базах возвращает id, поэтому перечитываем
+    for perm in (await Permission.all() if create_perms else permissions):
+        if ct := ContentType.instances_by_id.get(perm.content_type_id):
+            ct.permission_ids[perm.name] = perm.id
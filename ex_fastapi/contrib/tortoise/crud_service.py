@@ -1,22 +1,45 @@
+import asyncio
+import inspect
+import json
+import re
 from collections import defaultdict
-from functools import lru_cache
+from collections.abc import Awaitable, AsyncIterator, Callable, Collection
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import cache
 from typing import Type, Any, Optional, TypeVar, Sequence
+from uuid import uuid4
 
-from tortoise.fields import ManyToManyRelation
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q, RawSQL
+from tortoise.fields.relational import ManyToManyFieldInstance, ReverseRelation
 from tortoise.models import MetaInfo
 from tortoise.queryset import QuerySet
+from tortoise.signals import Signals
 from tortoise.transactions import in_transaction
+from pypika import Table
 from fastapi import BackgroundTasks, Request
 
 from ex_fastapi import CamelModel
+from ex_fastapi.caching import LRUCache, TTLCache
+from ex_fastapi.global_objects import get_user_cache
 from ex_fastapi.routers.base_crud_service import BaseCRUDService, PK, \
-    Handler, QsRelatedFunc, QsAnnotateFunc, QsDefaultFiltersFunc
-from ex_fastapi.routers.exceptions import ItemNotFound, NotUnique, NotFoundFK, MultipleFieldsError
+    Handler, QsRelatedFunc, QsAnnotateFunc, QsDefaultFiltersFunc, COUNT_STRATEGY, LIST_QUERY_MODE, \
+    QuerysetPlan, REPRESENTATION, READ_MODE
+from ex_fastapi.routers.cursor import Cursor, CursorKey
+from ex_fastapi.routers.exceptions import ItemNotFound, NotUnique, NotFoundFK, Required, MultipleFieldsError, \
+    FieldsError
 from ex_fastapi.routers.filters import BaseFilter
-from . import BaseModel
+from . import BaseModel, BaseUser, Permission, PermissionGroup
 
 
 TORTOISE_MODEL = TypeVar('TORTOISE_MODEL', bound=BaseModel)
+T = TypeVar('T')
+WINDOW_TOTAL_COUNT = 'window_total_count'
+NOT_FETCHED = object()
+# сбросы кэша пользователей, которые ждут коммита транзакции (user_cache_transaction)
+USER_CACHE_PENDING: ContextVar[Optional[list[tuple[Any, ...]]]] = ContextVar('user_cache_pending', default=None)
 
 
 class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
@@ -38,6 +61,13 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             node_key: str = 'parent_id',
             create_handlers: dict[Type[TORTOISE_MODEL], Handler] = None,
             edit_handlers: dict[Type[TORTOISE_MODEL], Handler] = None,
+            count_cache_ttl: float = 60,
+            list_query_mode: LIST_QUERY_MODE = 'sequential',
+            queryset_plan_cache_size: int = 1000,
+            optimistic_writes: bool = False,
+            fetch_before_delete: bool = False,
+            read_mode: READ_MODE = 'models',
+            stateless_permissions: bool = False,
     ):
         super().__init__(db_model)  # чтобы не ругался
         self.model = db_model
@@ -66,55 +96,105 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
         self.node_key = node_key
 
         self.create_handlers = create_handlers or {}
+        self.default_create_handlers: dict[Type[TORTOISE_MODEL], Handler] = {}
         self.edit_handlers = edit_handlers or {}
 
-    @lru_cache(maxsize=1000)
-    def _get_queryset(
-            self,
-            path: str,
-            method: str,
-            select_related: str,
-            prefetch_related: str,
-    ) -> QuerySet[TORTOISE_MODEL]:
-        query = self.model.all()
-        select_related = select_related.split(',') if select_related else ()
-        prefetch_related = prefetch_related.split(',') if select_related else ()
-        if default_filters := self.queryset_default_filters(path, method):
-            query = query.filter(**default_filters)
-        if annotate_fields := self.queryset_annotate_fields(path, method):
-            query = query.annotate(**annotate_fields)
-        if final_select_related := {*self.queryset_select_related(path, method), *select_related}:
-            query = query.select_related(*final_select_related)
-        if final_prefetch_related := {*self.queryset_prefetch_related(path, method), *prefetch_related}:
-            query = query.prefetch_related(*final_prefetch_related)
-        return query
+        self.count_cache = TTLCache(ttl=count_cache_ttl)
+        self.list_query_mode = list_query_mode
+        self.queryset_plan_cache = LRUCache(maxsize=queryset_plan_cache_size)
+        # без предварительных проверок unique и fk, ошибки берутся из IntegrityError (см. write_or_fields_error)
+        self.optimistic_writes = optimistic_writes
+        # delete_one через загрузку записи и instance.delete(), для сигналов удаления
+        self.fetch_before_delete = fetch_before_delete
+        self.read_mode = read_mode
+        # поля list_item_schema для .values(), None - схеме нужны объекты модели
+        self.values_fields = get_values_fields(self.model, self.list_item_schema) if read_mode == 'values' else None
+        # проверка прав по правам из токена (user_with_perms(stateless=True)), см. has_permissions
+        self.stateless_permissions = stateless_permissions
 
     def get_queryset(
             self,
             request: Request,
             select_related: Sequence[str],
             prefetch_related: Sequence[str],
+            fields: Sequence[str] = None,
     ) -> QuerySet[TORTOISE_MODEL]:
-        if request is None:
-            path, method = '', ''
-        else:
-            path, method = request.scope['route'].path, request.method
-        # select_related и prefetch_related переводим в строку с запятыми, чтобы lru_cache работал как хотим
-        select_related, prefetch_related = ','.join(select_related), ','.join(prefetch_related)
-        return self._get_queryset(path, method, select_related, prefetch_related)
+        # кэшируется только описание запроса, queryset каждый раз новый.
+        # model.all() привязывает queryset к соединению в момент создания, queryset из manager выбирает
+        # соединение при выполнении, поэтому работает и внутри in_transaction, созданной позже
+        plan = self.get_queryset_plan(*get_path_and_method(request), select_related, prefetch_related)
+        if fields is None:
+            return self.build_queryset(plan)
+        return self.build_sparse_queryset(plan, fields)
+
+    def build_queryset(self, plan: QuerysetPlan) -> QuerySet[TORTOISE_MODEL]:
+        query = self.model._meta.manager.get_queryset()
+        if plan.default_filters:
+            query = query.filter(**dict(plan.default_filters))
+        if plan.annotate_fields:
+            query = query.annotate(**dict(plan.annotate_fields))
+        if plan.select_related:
+            query = query.select_related(*plan.select_related)
+        if plan.prefetch_related:
+            query = query.prefetch_related(*plan.prefetch_related)
+        return query
+
+    def build_sparse_queryset(self, plan: QuerysetPlan, fields: Sequence[str]) -> QuerySet[TORTOISE_MODEL]:
+        """
+        Запрос только под fields (поля схемы/атрибуты записи): связи не из fields не загружаются, колонки выбираются
+        через .only(). Если какое-то поле не колонка, не связь и не аннотация (property может зависеть от чего угодно),
+        запрос обычный
+        """
+        fields = set(fields)
+        columns = get_sparse_columns(self.model, fields, {name for name, _ in plan.annotate_fields})
+        if columns is None:
+            return self.build_queryset(plan)
+        plan = only_relations(plan, fields)
+        query = self.build_queryset(plan)
+        # tortoise 0.19 сдвигает колонки select_related, если вместе с only есть аннотации (и COUNT(*) OVER() тоже)
+        if plan.select_related and (plan.annotate_fields or self.list_query_mode == 'window'):
+            return query
+        return query.only(*columns)
+
+    def get_list_queryset(
+            self,
+            request: Optional[Request],
+            select_related: Sequence[str],
+            prefetch_related: Sequence[str],
+            fields: Optional[Sequence[str]],
+            extra: Sequence[str] = (),
+    ) -> tuple[QuerySet[TORTOISE_MODEL], Optional[tuple[str, ...]]]:
+        """
+        queryset для get_all/get_all_by_cursor и колонки для .values(), если записи можно не собирать (read_mode),
+        extra - что ещё нужно в записях (ключи курсора). Аннотации известны только по запросу, поэтому последняя
+        проверка здесь: если поля схемы не колонки и не аннотации этого запроса - объекты модели
+        """
+        plan = self.get_queryset_plan(*get_path_and_method(request), select_related, prefetch_related)
+        if self.values_fields is not None:
+            values = tuple(dict.fromkeys((
+                *(name for name in self.values_fields if fields is None or name in fields), *extra
+            )))
+            annotations = {name for name, _ in plan.annotate_fields}
+            if all(name in self.opts.fields_db_projection or name in annotations for name in values):
+                return self.build_queryset(only_relations(plan, ())), values
+        if fields is None:
+            return self.build_queryset(plan), None
+        return self.build_sparse_queryset(plan, (*fields, *extra)), None
 
     async def get_all(
             self,
             skip: Optional[int], limit: Optional[int],
-            sort: set[str],
+            sort: list[str],
             filters: list[BaseFilter],
             *,
             background_tasks: BackgroundTasks = None,
             request: Request = None,
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
-    ) -> tuple[list[TORTOISE_MODEL], int]:
-        query = self.get_queryset(request, select_related, prefetch_related)
+            count_strategy: COUNT_STRATEGY = 'exact',
+            fields: Sequence[str] = None,
+    ) -> tuple[list[TORTOISE_MODEL] | list[dict[str, Any]], Optional[int]]:
+        query, values = self.get_list_queryset(request, select_related, prefetch_related, fields)
         for f in filters:
             query = f.filter(query)
         base_query = query
@@ -124,11 +204,169 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             query = query.offset(skip)
         if limit:
             query = query.limit(limit)
-        async with in_transaction():
-            result = await query
-            count = await base_query.count()
+        return await self.fetch_page(
+            query, base_query, filters, count_strategy,
+            request=request,
+            first_page=not skip,
+            values=values,
+        )
+
+    async def get_all_by_cursor(
+            self,
+            cursor: Optional[Cursor], limit: Optional[int],
+            sort: list[str],
+            filters: list[BaseFilter],
+            *,
+            background_tasks: BackgroundTasks = None,
+            request: Request = None,
+            select_related: Sequence[str] = (),
+            prefetch_related: Sequence[str] = (),
+            count_strategy: COUNT_STRATEGY = 'exact',
+            fields: Sequence[str] = None,
+    ) -> tuple[list[TORTOISE_MODEL] | list[dict[str, Any]], Optional[int], Optional[Cursor], Optional[Cursor]]:
+        keys = self.get_cursor_keys(sort)
+        key_fields = tuple(key.field for key in keys)
+        # значения ключей берутся из записей для курсоров
+        query, values = self.get_list_queryset(request, select_related, prefetch_related, fields, key_fields)
+        for f in filters:
+            query = f.filter(query)
+        base_query = query
+        backward = cursor is not None and cursor.direction == 'prev'
+        if cursor is not None:
+            query = query.filter(get_keyset_q(self.opts, keys, cursor.values, backward=backward))
+        query = query.order_by(*(key.order_by(backward) for key in keys))
+        if limit:
+            # одна лишняя запись показывает, есть ли что-то дальше
+            query = query.limit(limit + 1)
+        result, count = await self.fetch_page(
+            query, base_query, filters, count_strategy,
+            request=request,
+            first_page=cursor is None,
+            values=values,
+            keyset=cursor is not None,
+        )
+        get_key = dict.__getitem__ if values is not None else getattr
+
+        has_more = bool(limit) and len(result) > limit
+        if has_more:
+            result = result[:limit]
+        if backward:
+            result.reverse()
+        next_cursor = prev_cursor = None
+        if result:
+            if has_more or backward:
+                next_cursor = Cursor('next', keys, tuple(get_key(result[-1], k) for k in key_fields))
+            if (has_more and backward) or (not backward and cursor is not None):
+                prev_cursor = Cursor('prev', keys, tuple(get_key(result[0], k) for k in key_fields))
+        return result, count, next_cursor, prev_cursor
+
+    async def export(
+            self,
+            sort: list[str],
+            filters: list[BaseFilter],
+            *,
+            request: Request = None,
+            select_related: Sequence[str] = (),
+            prefetch_related: Sequence[str] = (),
+            fields: Sequence[str] = None,
+            batch_size: int = 1000,
+    ) -> AsyncIterator[list[TORTOISE_MODEL] | list[dict[str, Any]]]:
+        """
+        Пачки keyset'ом по sort + pk, как get_all_by_cursor: каждая следующая начинается после последней записи
+        предыдущей, поэтому стоимость пачки не растёт к концу выборки и в памяти только одна пачка.
+        Пачки - отдельные запросы, не один снимок таблицы
+        """
+        keys = self.get_cursor_keys(sort)
+        key_fields = tuple(key.field for key in keys)
+        query, values = self.get_list_queryset(request, select_related, prefetch_related, fields, key_fields)
+        for f in filters:
+            query = f.filter(query)
+        query = query.order_by(*(key.order_by() for key in keys)).limit(batch_size)
+        get_key = dict.__getitem__ if values is not None else getattr
+        last: Optional[tuple[Any, ...]] = None
+        while True:
+            batch_query = query if last is None else query.filter(get_keyset_q(self.opts, keys, last))
+            batch = await (batch_query if values is None else batch_query.values(*values))
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            batch_last = tuple(get_key(batch[-1], k) for k in key_fields)
+            if batch_last == last:
+                # ключи заканчиваются pk, повтор значит, что условие keyset не сдвигает выборку
+                raise RuntimeError(f'{self.model.__name__} export: keyset не продвинулся после {last}')
+            last = batch_last
+
+    async def fetch_page(
+            self,
+            query: QuerySet[TORTOISE_MODEL],
+            base_query: QuerySet[TORTOISE_MODEL],
+            filters: list[BaseFilter],
+            count_strategy: COUNT_STRATEGY,
+            *,
+            request: Request = None,
+            first_page: bool = True,
+            values: Sequence[str] = None,
+            keyset: bool = False,
+    ) -> tuple[list[TORTOISE_MODEL] | list[dict[str, Any]], Optional[int]]:
+        """
+        query - запрос страницы, base_query - тот же запрос без сортировки и limit/offset для подсчёта.
+        first_page нужен для window, пустая не первая страница не говорит ничего о количестве.
+        values - колонки, если страница нужна dict'ами (.values()).
+        keyset - query отфильтрован по курсору, COUNT(*) OVER() посчитал бы только записи после курсора,
+        поэтому для window количество отдельным запросом по base_query, как в gather
+        """
+        match self.list_query_mode:
+            case 'window' if count_strategy == 'exact' and not keyset:
+                query = query.annotate(**{WINDOW_TOTAL_COUNT: RawSQL('COUNT(*) OVER()')})
+                if values is not None:
+                    # лишний ключ в dict'ах не мешает, сериализатор берёт только поля схемы
+                    result = await query.values(*values, WINDOW_TOTAL_COUNT)
+                else:
+                    result = await query
+                if result:
+                    count = result[0][WINDOW_TOTAL_COUNT] if values is not None \
+                        else getattr(result[0], WINDOW_TOTAL_COUNT)
+                elif first_page:
+                    count = 0
+                else:
+                    count = await base_query.count()
+            case 'gather' | 'window':
+                result, count = await asyncio.gather(
+                    query if values is None else query.values(*values),
+                    self.count(base_query, filters, count_strategy, request=request),
+                )
+            case _:
+                async with in_transaction():
+                    result = await (query if values is None else query.values(*values))
+                    count = await self.count(base_query, filters, count_strategy, request=request)
         return result, count
 
+    async def count(
+            self,
+            query: QuerySet[TORTOISE_MODEL],
+            filters: list[BaseFilter],
+            strategy: COUNT_STRATEGY,
+            *,
+            request: Request = None,
+    ) -> Optional[int]:
+        match strategy:
+            case 'none':
+                return None
+            case 'exact':
+                return await query.count()
+            case 'estimate':
+                return await estimate_count(query)
+            case 'cached':
+                key = (*get_path_and_method(request), *sorted((f.camel_source, f.value) for f in filters))
+                count = self.count_cache.get(key)
+                if count is None:
+                    count = await query.count()
+                    self.count_cache.set(key, count)
+                return count
+            case _:
+                raise Exception(f'Unknown count strategy: {strategy}')
+
     def _get_many_queryset(
             self,
             item_ids: list[PK],
@@ -204,7 +442,8 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             request: Request = None,
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
-            inside_transaction: bool = False
+            inside_transaction: bool = False,
+            representation: REPRESENTATION = 'full',
     ) -> TORTOISE_MODEL:
         model: Type[TORTOISE_MODEL] = model or self.model
         fk_fields, bfk_fields, o2o_fields, bo2o_fields, m2m_fields = exclude_fk_bfk_o2o_bo2o_m2m(model, data)
@@ -212,13 +451,24 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
         errors = MultipleFieldsError()
 
         async def get_new_instance():
-            not_unique = await model.check_unique(data.dict(include=model._meta.db_fields))
-            if not_unique:
-                errors.add_errors(NotUnique(fields=not_unique))
-                raise errors
-            instance: TORTOISE_MODEL = await self.handle_create(model)(
-                data, should_exclude=exclude_dict['__root__'], defaults=defaults
-            )
+            create = self.handle_create(model)
+            if self.optimistic_writes:
+                instance: TORTOISE_MODEL = await self.write_or_fields_error(
+                    model,
+                    lambda: create(data, should_exclude=exclude_dict['__root__'], defaults=defaults),
+                    data.dict(include=model._meta.db_fields),
+                    fk_fields,
+                    data,
+                )
+            else:
+                # fk проверяются до insert, иначе вместо notFoundFK будет IntegrityError
+                if check_errors := await self.check_fields(
+                        model, data.dict(include=model._meta.db_fields), fk_fields, data
+                ):
+                    raise check_errors
+                instance: TORTOISE_MODEL = await create(
+                    data, should_exclude=exclude_dict['__root__'], defaults=defaults
+                )
             if o2o_fields:
                 try:
                     await self.create_o2o(instance, o2o_fields, data, exclude_dict)
@@ -229,11 +479,8 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                     await self.create_backward_o2o(instance, bo2o_fields, data, exclude_dict)
                 except MultipleFieldsError as e:
                     errors.add_errors(*e)
-            if fk_fields:
-                try:
-                    await self.set_fk(instance, fk_fields, data)
-                except NotFoundFK as e:
-                    errors.add_errors(e)
+            if fk_fields and not self.optimistic_writes:
+                await self.set_fk(instance, fk_fields, data, check=False)
             if bfk_fields:
                 try:
                     await self.create_backward_fk(instance, bfk_fields, data, exclude_dict)
@@ -241,7 +488,10 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                     errors.add_errors(*e)
             if errors:
                 raise errors
-            await self.save_m2m(instance, data, m2m_fields=m2m_fields, clear=False)
+            try:
+                await self.save_m2m(instance, data, m2m_fields=m2m_fields, clear=False)
+            except NotFoundFK as e:
+                raise errors.add_errors(e)
             return instance
 
         if inside_transaction:
@@ -249,13 +499,93 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
         else:
             async with in_transaction():
                 new_instance = await get_new_instance()
-                return await self.get_one(
-                    new_instance.pk,
+                return await self.get_representation(
+                    new_instance,
+                    representation,
                     request=request,
                     select_related=select_related,
                     prefetch_related=prefetch_related,
                 )
 
+    async def create_many(
+            self,
+            items: list[CamelModel],
+            *,
+            background_tasks: BackgroundTasks = None,
+            defaults: dict[str, Any] = None,
+            request: Request = None,
+            chunk_size: int = 500,
+    ) -> int:
+        """Создание пачки в одной транзакции через create_items. Ошибки - с индексом записи в префиксе (0.name)"""
+        errors = MultipleFieldsError()
+        async with in_transaction():
+            items_errors = await self.create_items(self.model, items, defaults=defaults, chunk_size=chunk_size)
+            for i, item_errors in enumerate(items_errors):
+                errors.add_errors(*item_errors.with_prefix(str(i)))
+            if errors:
+                raise errors
+        return len(items)
+
+    async def create_items(
+            self,
+            model: Type[TORTOISE_MODEL],
+            items: Sequence[CamelModel],
+            *,
+            exclude: set[str] = None,
+            defaults: dict[str, Any] = None,
+            chunk_size: int = 500,
+    ) -> list[MultipleFieldsError]:
+        """
+        Создание пачки записей модели, вызывать в транзакции. unique и fk проверяются сразу для всех записей,
+        вставка через bulk_create по chunk_size, при ошибках ничего не вставляется. Если в записях есть вложенные
+        связи или для модели свой обработчик создания, записи создаются по одной через create.
+        Не переданные None из схемы не пишутся, чтобы сработали значения по умолчанию модели, а незаполненные
+        обязательные колонки - ошибка required у записи. Возвращает ошибки по записям
+        """
+        relations = [exclude_fk_bfk_o2o_bo2o_m2m(model, item) for item in items]
+        items_errors = [MultipleFieldsError() for _ in items]
+        if model in self.create_handlers or any(any(rel[1:]) for rel in relations):
+            for item, item_errors in zip(items, items_errors):
+                try:
+                    await self.create(item, exclude=exclude, model=model, defaults=defaults, inside_transaction=True)
+                except MultipleFieldsError as e:
+                    item_errors.add_errors(*e)
+            return items_errors
+
+        opts = model._meta
+        include_fields = opts.db_fields.difference(get_exclude_dict(exclude or set())['__root__'])
+        db_defaults = get_db_defaults(model, defaults)
+        items_dicts = [
+            {
+                **{
+                    key: value for key, value in item.dict(include=include_fields).items()
+                    if value is not None or key in item.__fields_set__
+                },
+                **db_defaults,
+            }
+            for item in items
+        ]
+        if opts.pk.generated:
+            # вложенные схемы часто с необязательным id, для новых записей он None
+            for item_dict in items_dicts:
+                if item_dict.get(opts.pk_attr, 0) is None:
+                    del item_dict[opts.pk_attr]
+        required_fields = get_required_fields(model)
+        not_unique = await model.check_unique_many(items_dicts, chunk_size=chunk_size)
+        not_found_fk = await self.get_not_found_fk_many(model, [(rel[0], item) for rel, item in zip(relations, items)])
+        for item_errors, item_dict, item_not_unique, item_not_found_fk in zip(
+                items_errors, items_dicts, not_unique, not_found_fk
+        ):
+            if missing := [name for name in required_fields if item_dict.get(name) is None]:
+                item_errors.add_errors(Required(fields=missing))
+            if item_not_unique:
+                item_errors.add_errors(NotUnique(fields=item_not_unique))
+            if item_not_found_fk:
+                item_errors.add_errors(NotFoundFK(fields=item_not_found_fk))
+        if not any(items_errors):
+            await model.bulk_create([model(**item_dict) for item_dict in items_dicts], batch_size=chunk_size)
+        return items_errors
+
     async def create_o2o(
             self,
             instance: TORTOISE_MODEL,
@@ -330,18 +660,14 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             back_fk_source_field = back_fk_model._meta \
                 .fields_map[back_fk_field.relation_source_field] \
                 .reference.model_field_name
-            back_fk_exclude = exclude_dict[field_name]
-            for back_fk_data in getattr(data, field_name):
-                try:
-                    await self.create(
-                        back_fk_data,
-                        exclude=back_fk_exclude,
-                        model=back_fk_model,
-                        defaults={back_fk_source_field: instance},
-                        inside_transaction=True,
-                    )
-                except MultipleFieldsError as e:
-                    errors.add_errors(*e.with_prefix(field_name))
+            items_errors = await self.create_items(
+                back_fk_model,
+                getattr(data, field_name),
+                exclude=exclude_dict[field_name],
+                defaults={back_fk_source_field: instance},
+            )
+            for item_errors in items_errors:
+                errors.add_errors(*item_errors.with_prefix(field_name))
         if errors:
             raise errors
         await instance.fetch_related(*back_fk_fields)
@@ -357,7 +683,8 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             request: Request = None,
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
-            inside_transaction: bool = False
+            inside_transaction: bool = False,
+            representation: REPRESENTATION = 'full',
     ) -> TORTOISE_MODEL:
         model: Type[TORTOISE_MODEL] = item_id_or_instance.__class__ if isinstance(item_id_or_instance, BaseModel) \
             else self.model
@@ -375,9 +702,31 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                     select_related=select_related,
                     prefetch_related=prefetch_related
                 )
-            if not_unique := await model.check_unique(data.dict(include=model._meta.db_fields, exclude_unset=True)):
-                errors.add_errors(NotUnique(fields=not_unique))
-            await self.handle_edit(instance)(data, should_exclude=exclude_dict['__root__'], defaults=defaults)
+            if not self.has_changes(instance, data, exclude, defaults):
+                # ни колонки, ни вложенные связи не меняются - без проверок и запросов
+                return instance
+            edit = self.handle_edit(instance)
+            # не изменившиеся fk не проверяем
+            changed_fk_fields = {f for f in fk_fields if getattr(instance, f) != getattr(data, f)}
+            if self.optimistic_writes:
+                await self.write_or_fields_error(
+                    model,
+                    lambda: edit(data, should_exclude=exclude_dict['__root__'], defaults=defaults),
+                    data.dict(include=model._meta.db_fields, exclude_unset=True),
+                    changed_fk_fields,
+                    data,
+                    instance=instance,
+                )
+            else:
+                if check_errors := await self.check_fields(
+                        model,
+                        data.dict(include=model._meta.db_fields, exclude_unset=True),
+                        changed_fk_fields,
+                        data,
+                        instance=instance,
+                ):
+                    raise check_errors
+                await edit(data, should_exclude=exclude_dict['__root__'], defaults=defaults)
             if o2o_fields:
                 try:
                     await self.edit_o2o(instance, o2o_fields, data, exclude_dict)
@@ -388,11 +737,8 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                     await self.edit_backward_o2o(instance, bo2o_fields, data, exclude_dict)
                 except MultipleFieldsError as e:
                     errors.add_errors(*e)
-            if fk_fields:
-                try:
-                    await self.set_fk(instance, fk_fields, data)
-                except NotFoundFK as e:
-                    errors.add_errors(e)
+            if fk_fields and not self.optimistic_writes:
+                await self.set_fk(instance, fk_fields, data, check=False)
             if bfk_fields:
                 try:
                     await self.edit_backward_fk(instance, bfk_fields, data, exclude_dict)
@@ -400,20 +746,242 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                     errors.add_errors(*e)
             if errors:
                 raise errors
-            await self.save_m2m(instance, data, m2m_fields=m2m_fields)
+            try:
+                await self.save_m2m(instance, data, m2m_fields=m2m_fields)
+            except NotFoundFK as e:
+                raise errors.add_errors(e)
             return instance
 
         if inside_transaction:
-            return await get_changed_instance()
+            changed_instance = await get_changed_instance()
+            # транзакция вызывающего ещё не закоммичена, сброс кэша - после её коммита
+            self.invalidate_user_cache_on_commit(model, [changed_instance.pk], m2m_fields)
+            return changed_instance
         else:
-            async with in_transaction():
+            async with user_cache_transaction():
                 changed_instance = await get_changed_instance()
+                self.invalidate_user_cache_on_commit(model, [changed_instance.pk], m2m_fields)
+            return await self.get_representation(
+                changed_instance,
+                representation,
+                request=request,
+                select_related=select_related,
+                prefetch_related=prefetch_related,
+            )
+
+    def has_changes(
+            self,
+            instance: TORTOISE_MODEL,
+            data: CamelModel,
+            exclude: set[str] = None,
+            defaults: dict[str, Any] = None,
+    ) -> bool:
+        """
+        Поменяет ли edit что-нибудь: колонки сравниваются с instance, вложенные связи - с загруженными записями.
+        Незагруженные связи, новые вложенные записи и модели со своим обработчиком (edit_handlers) - изменение
+        """
+        model = instance.__class__
+        if model in self.edit_handlers:
+            return True
+        opts = model._meta
+        exclude_dict = get_exclude_dict(exclude or set())
+        data_dict = data.dict(include=opts.db_fields.difference(exclude_dict['__root__']), exclude_unset=True)
+        if defaults:
+            data_dict.update(defaults)
+        if get_changed_values(instance, data_dict):
+            return True
+        _, bfk_fields, o2o_fields, bo2o_fields, m2m_fields = exclude_fk_bfk_o2o_bo2o_m2m(model, data)
+        for field_name in o2o_fields | bo2o_fields:
+            if not relation_fetched(instance, field_name) or (related := getattr(instance, field_name)) is None:
+                return True
+            if self.has_changes(related, getattr(data, field_name), exclude_dict[field_name]):
+                return True
+        for field_name in bfk_fields:
+            if not relation_fetched(instance, field_name):
+                return True
+            related_pk_attr = opts.fields_map[field_name].related_model._meta.pk_attr
+            related_by_pk = {related.pk: related for related in getattr(instance, field_name)}
+            for related_data in getattr(data, field_name):
+                related = related_by_pk.get(getattr(related_data, related_pk_attr, None))
+                if related is None or self.has_changes(related, related_data, exclude_dict[field_name]):
+                    return True
+        for field_name in m2m_fields:
+            if not relation_fetched(instance, field_name):
+                return True
+            remote_pk = opts.fields_map[field_name].related_model._meta.pk
+            ids = {remote_pk.to_python_value(pk) for pk in getattr(data, field_name)}
+            if ids != {related.pk for related in getattr(instance, field_name)}:
+                return True
+        return False
+
+    async def get_representation(
+            self,
+            instance: TORTOISE_MODEL,
+            representation: REPRESENTATION,
+            *,
+            request: Request = None,
+            select_related: Sequence[str] = (),
+            prefetch_related: Sequence[str] = (),
+    ) -> TORTOISE_MODEL:
+        """
+        Запись для ответа после create/edit (см. REPRESENTATION). auto: если read_schema нужны поля, которых нет
+        у записи (аннотации) - один запрос со связями только из read_schema, иначе догружаются только
+        незагруженные связи из read_schema, а если всё уже есть - без запросов
+        """
+        if representation == 'minimal':
+            return instance
+        if representation == 'full':
             return await self.get_one(
-                changed_instance.pk,
+                instance.pk,
                 request=request,
                 select_related=select_related,
                 prefetch_related=prefetch_related,
             )
+        plan = self.get_queryset_plan(*get_path_and_method(request), select_related, prefetch_related)
+        relations, not_on_instance = get_schema_usage(self.model, self.get_read_schema())
+        if not_on_instance:
+            instance = await self.build_queryset(only_relations(plan, relations)).get_or_none(pk=instance.pk)
+            if instance is None:
+                raise ItemNotFound()
+            return instance
+        related_paths = (*plan.select_related, *plan.prefetch_related)
+        to_fetch: list[str] = []
+        for field_name in relations:
+            # вложенные связи (items__product) загружаются вместе со связью (items)
+            if nested := [p for p in related_paths if p.startswith(f'{field_name}__')]:
+                to_fetch.extend(nested)
+            elif not relation_fetched(instance, field_name):
+                to_fetch.append(field_name)
+        if to_fetch:
+            await instance.fetch_related(*to_fetch)
+        return instance
+
+    async def edit_many(
+            self,
+            item_ids: Sequence[PK],
+            data: CamelModel | Sequence[CamelModel],
+            *,
+            background_tasks: BackgroundTasks = None,
+            defaults: dict[str, Any] = None,
+            request: Request = None,
+            chunk_size: int = 500,
+    ) -> int:
+        """
+        data - одни изменения для всех item_ids (один UPDATE ... WHERE pk IN) или по записи на каждый id,
+        дальше edit_items. Несуществующие id пропускаются, возвращается количество обновлённых записей.
+        Ошибки - с id записи в префиксе (7.name)
+        """
+        items = [data] * len(item_ids) if isinstance(data, CamelModel) else list(data)
+        errors = MultipleFieldsError()
+        async with user_cache_transaction():
+            edited_count, items_errors = await self.edit_items(
+                self.model, list(zip(item_ids, items)), defaults=defaults, request=request, chunk_size=chunk_size
+            )
+            for item_id, item_errors in zip(item_ids, items_errors):
+                errors.add_errors(*item_errors.with_prefix(str(item_id)))
+            if errors:
+                raise errors
+            self.invalidate_user_cache_on_commit(self.model, item_ids, set())
+        return edited_count
+
+    async def edit_items(
+            self,
+            model: Type[TORTOISE_MODEL],
+            items: Sequence[tuple[PK | TORTOISE_MODEL, CamelModel]],
+            *,
+            exclude: set[str] = None,
+            defaults: dict[str, Any] = None,
+            request: Request = None,
+            chunk_size: int = 500,
+    ) -> tuple[int, list[MultipleFieldsError]]:
+        """
+        Редактирование пачки записей модели, вызывать в транзакции. Записи - id или уже загруженные instance,
+        загруженные обновляются и в памяти. unique и fk проверяются сразу для всех записей; записи с одинаковыми
+        изменениями обновляются одним UPDATE ... WHERE pk IN, с одинаковым набором полей - одним bulk_update.
+        Если в изменениях есть вложенные связи или для модели свой обработчик редактирования,
+        записи редактируются по одной через edit. Возвращает количество обновлённых записей и ошибки по записям
+        """
+        opts = model._meta
+        relations = [exclude_fk_bfk_o2o_bo2o_m2m(model, data) for _, data in items]
+        items_errors = [MultipleFieldsError() for _ in items]
+        if model in self.edit_handlers or any(any(rel[1:]) for rel in relations):
+            edited_count = 0
+            for (item, data), item_errors in zip(items, items_errors):
+                try:
+                    await self.edit(
+                        item, data, exclude=exclude, defaults=defaults, request=request, inside_transaction=True
+                    )
+                    edited_count += 1
+                except ItemNotFound:
+                    continue
+                except MultipleFieldsError as e:
+                    item_errors.add_errors(*e)
+            return edited_count, items_errors
+
+        item_ids = [item.pk if isinstance(item, BaseModel) else item for item, _ in items]
+        instances = {item.pk: item for item, _ in items if isinstance(item, BaseModel)}
+        # pk не меняем, он может быть в изменениях как id записи
+        include_fields = opts.db_fields.difference({opts.pk_attr}, get_exclude_dict(exclude or set())['__root__'])
+        db_defaults = get_db_defaults(model, defaults)
+        items_dicts = [
+            {**data.dict(include=include_fields, exclude_unset=True), **db_defaults} for _, data in items
+        ]
+        # у загруженных записей обновляем только изменившееся, записи без изменений не трогаем
+        items_dicts = [
+            get_changed_values(instances[item_id], item_dict) if item_id in instances else item_dict
+            for item_id, item_dict in zip(item_ids, items_dicts)
+        ]
+        queryset = self.get_queryset(request=request, select_related=(), prefetch_related=()) \
+            if model is self.model else model.all()
+
+        unique_keys = {
+            key for keys in model.get_unique_constraints()
+            if any(key in item_dict for key in keys for item_dict in items_dicts) for key in keys
+        }
+        not_unique: list[list[str]] = [[] for _ in items]
+        if unique_keys:
+            current_by_pk = {
+                pk: {opts.pk_attr: pk, **{key: getattr(instance, key) for key in unique_keys}}
+                for pk, instance in instances.items()
+            }
+            if not_loaded := [pk for pk in item_ids if pk not in current_by_pk]:
+                current_by_pk.update({row[opts.pk_attr]: row for row in await queryset.filter(
+                    pk__in=not_loaded
+                ).values(opts.pk_attr, *unique_keys)})
+            not_unique = await model.check_unique_many(
+                items_dicts, chunk_size=chunk_size, current=[current_by_pk.get(pk) for pk in item_ids]
+            )
+        # fk, которые не поменялись, не проверяем
+        not_found_fk = await self.get_not_found_fk_many(model, [
+            (rel[0] & item_dict.keys(), data) for rel, (_, data), item_dict in zip(relations, items, items_dicts)
+        ])
+        for item_errors, item_not_unique, item_not_found_fk in zip(items_errors, not_unique, not_found_fk):
+            if item_not_unique:
+                item_errors.add_errors(NotUnique(fields=item_not_unique))
+            if item_not_found_fk:
+                item_errors.add_errors(NotFoundFK(fields=item_not_found_fk))
+        if any(items_errors):
+            return 0, items_errors
+
+        groups: dict[tuple[str, ...], list[tuple[PK, dict[str, Any]]]] = defaultdict(list)
+        for item_id, item_dict in zip(item_ids, items_dicts):
+            if item_dict:
+                groups[tuple(sorted(item_dict))].append((item_id, item_dict))
+        edited_count = 0
+        for fields, group in groups.items():
+            if all(item_dict == group[0][1] for _, item_dict in group):
+                edited_count += await queryset.filter(pk__in=[item_id for item_id, _ in group]).update(**group[0][1])
+            else:
+                edited_count += await queryset.bulk_update(
+                    [get_update_object(model, item_id, item_dict) for item_id, item_dict in group],
+                    fields,
+                    batch_size=chunk_size,
+                )
+
+        for item_id, item_dict in zip(item_ids, items_dicts):
+            if (instance := instances.get(item_id)) is not None and item_dict:
+                set_values(instance, item_dict)
+        return edited_count, items_errors
 
     async def edit_o2o(
             self,
@@ -501,16 +1069,11 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             data: CamelModel,
             exclude_dict: dict[str, set[str]],
     ):
-        def get_fk_instance(instances: list[TORTOISE_MODEL], pk_value) -> TORTOISE_MODEL | None:
-            for i in instances:
-                if i.pk == pk_value:
-                    return i
-
         not_found_fk: set[str] = set()
         errors = MultipleFieldsError()
         need_refetch: set[str] = set()
         for field_name in backward_fk_fields:
-            back_fk_instances: list[TORTOISE_MODEL] = getattr(instance, field_name)
+            back_fk_instances: dict[Any, TORTOISE_MODEL] = {i.pk: i for i in getattr(instance, field_name)}
             back_fk_field = instance._meta.fields_map[field_name]
             back_fk_model: Type[TORTOISE_MODEL] = back_fk_field.related_model
             back_fk_source_field = back_fk_model._meta \
@@ -518,31 +1081,30 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                 .reference.model_field_name
             back_pk_attr = back_fk_model._meta.pk_attr
             back_o2o_exclude = exclude_dict[field_name]
+            to_edit: list[tuple[TORTOISE_MODEL, CamelModel]] = []
+            to_create: list[CamelModel] = []
             for back_fk_data in getattr(data, field_name):
-                pk = getattr(back_fk_data, back_pk_attr, None)
-                try:
-                    if pk:
-                        fk_instance = get_fk_instance(back_fk_instances, pk)
-                        if not fk_instance:
-                            not_found_fk.add(field_name)
-                        else:
-                            await self.edit(
-                                fk_instance,
-                                back_fk_data,
-                                exclude=back_o2o_exclude,
-                                inside_transaction=True,
-                            )
+                if pk := getattr(back_fk_data, back_pk_attr, None):
+                    if (fk_instance := back_fk_instances.get(pk)) is None:
+                        not_found_fk.add(field_name)
                     else:
-                        await self.create(
-                            back_fk_data,
-                            exclude=back_o2o_exclude,
-                            model=back_fk_model,
-                            defaults={back_fk_source_field: instance},
-                            inside_transaction=True,
-                        )
-                        need_refetch.add(field_name)
-                except MultipleFieldsError as e:
-                    errors.add_errors(*e.with_prefix(field_name))
+                        to_edit.append((fk_instance, back_fk_data))
+                else:
+                    to_create.append(back_fk_data)
+            items_errors: list[MultipleFieldsError] = []
+            if to_edit:
+                _, edit_errors = await self.edit_items(back_fk_model, to_edit, exclude=back_o2o_exclude)
+                items_errors.extend(edit_errors)
+            if to_create:
+                items_errors.extend(await self.create_items(
+                    back_fk_model,
+                    to_create,
+                    exclude=back_o2o_exclude,
+                    defaults={back_fk_source_field: instance},
+                ))
+                need_refetch.add(field_name)
+            for item_errors in items_errors:
+                errors.add_errors(*item_errors.with_prefix(field_name))
         if not_found_fk:
             errors.add_errors(NotFoundFK(fields=not_found_fk))
         if errors:
@@ -550,29 +1112,104 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
         if need_refetch:
             await instance.fetch_related(*need_refetch)
 
+    async def write_or_fields_error(
+            self,
+            model: Type[TORTOISE_MODEL],
+            write: Callable[[], Awaitable[T]],
+            unique_data: dict[str, Any],
+            fk_fields: set[str],
+            data: CamelModel,
+            instance: TORTOISE_MODEL = None,
+    ) -> T:
+        """
+        Запись без предварительных проверок в savepoint, при IntegrityError поля ошибки берутся из сообщения базы.
+        Если по сообщению не понять, откатываемся к savepoint и проверяем как обычно (check_unique и fk)
+        """
+        try:
+            async with savepoint(model._meta.db):
+                return await write()
+        except IntegrityError as e:
+            if (error := integrity_error_fields(model, e)) is not None:
+                raise MultipleFieldsError(errors=[error])
+            if errors := await self.check_fields(model, unique_data, fk_fields, data, instance=instance):
+                raise errors
+            raise
+
+    async def check_fields(
+            self,
+            model: Type[TORTOISE_MODEL],
+            unique_data: dict[str, Any],
+            fk_fields: set[str],
+            data: CamelModel,
+            instance: TORTOISE_MODEL = None,
+    ) -> MultipleFieldsError:
+        """Проверки unique и существования fk перед записью"""
+        errors = MultipleFieldsError()
+        if not_unique := await model.check_unique(unique_data, instance=instance):
+            errors.add_errors(NotUnique(fields=not_unique))
+        if fk_fields and (not_found_fk := await self.get_not_found_fk(model, fk_fields, data)):
+            errors.add_errors(NotFoundFK(fields=not_found_fk))
+        return errors
+
+    @classmethod
+    async def get_not_found_fk(cls, model: Type[TORTOISE_MODEL], fk_fields: set[str], data: CamelModel) -> set[str]:
+        return (await cls.get_not_found_fk_many(model, [(fk_fields, data)]))[0]
+
+    @staticmethod
+    async def get_not_found_fk_many(
+            model: Type[TORTOISE_MODEL],
+            items: list[tuple[set[str], CamelModel]],
+    ) -> list[set[str]]:
+        """По одному запросу pk__in на связанную модель для всех записей, сами записи не загружаются"""
+        fk_map = get_fk_map(model)
+        values_by_model: dict[Type[TORTOISE_MODEL], set[Any]] = defaultdict(set)
+        not_found_fk: list[set[str]] = [set() for _ in items]
+        for i, (fk_fields, data) in enumerate(items):
+            for source_field_name in fk_fields:
+                rel_model, field_name = fk_map[source_field_name]
+                value = getattr(data, source_field_name)
+                if value is None:
+                    if not model._meta.fields_map[field_name].null:
+                        not_found_fk[i].add(source_field_name)
+                else:
+                    values_by_model[rel_model].add(value)
+        found: dict[Type[TORTOISE_MODEL], set[Any]] = {}
+        for rel_model, values in values_by_model.items():
+            found[rel_model] = set(await rel_model.filter(pk__in=values).values_list(
+                rel_model._meta.pk_attr, flat=True
+            ))
+        for i, (fk_fields, data) in enumerate(items):
+            for source_field_name in fk_fields:
+                value = getattr(data, source_field_name)
+                if value is not None and value not in found[fk_map[source_field_name][0]]:
+                    not_found_fk[i].add(source_field_name)
+        return not_found_fk
+
     async def set_fk(
             self,
             instance: TORTOISE_MODEL,
             fk_fields: set[str],
             data: CamelModel,
-            not_found_fk: set[str] = None
+            not_found_fk: set[str] = None,
+            check: bool = True,
     ) -> None:
-        opts = instance._meta
-        fk_fields_map: dict[str, tuple[Type[TORTOISE_MODEL], str]] = {
-            (f_opts := opts.fields_map[f]).source_field: (f_opts.related_model, f) for f in opts.fk_fields
-        }
+        """check=False - fk уже проверены (check_fields), только записываются изменившиеся _id"""
         not_found_fk: set[str] = not_found_fk or set()
-        for source_field_name in fk_fields:
-            value = getattr(data, source_field_name)
-            rel_model, field_name = fk_fields_map[source_field_name]
-            rel_instance = await rel_model.get_or_none(pk=value)
-            if rel_instance is None:
-                not_found_fk.add(source_field_name)
-            else:
-                setattr(instance, field_name, rel_instance)
+        if check:
+            not_found_fk |= await self.get_not_found_fk(instance.__class__, fk_fields, data)
         if not_found_fk:
             raise NotFoundFK(fields=not_found_fk)
-        await instance.save(force_update=True)
+        fk_map = get_fk_map(instance.__class__)
+        changed: list[str] = []
+        for source_field_name in fk_fields:
+            value = getattr(data, source_field_name)
+            if getattr(instance, source_field_name) != value:
+                setattr(instance, source_field_name, value)
+                # загруженная ранее связанная запись больше не актуальна
+                instance.__dict__.pop(f'_{fk_map[source_field_name][1]}', None)
+                changed.append(source_field_name)
+        if changed:
+            await instance.save(force_update=True, update_fields=changed)
 
     async def delete_many(
             self,
@@ -583,12 +1220,14 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
     ) -> int:
-        return await self._get_many_queryset(
+        deleted_count = await self._get_many_queryset(
             item_ids,
             request=request,
             select_related=select_related,
             prefetch_related=prefetch_related,
         ).delete()
+        await self.invalidate_user_cache(self.model, item_ids)
+        return deleted_count
 
     async def delete_one(
             self,
@@ -599,17 +1238,73 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
     ) -> None:
-        item = await self.get_one(
-            item_id,
-            background_tasks=background_tasks,
-            request=request,
-            select_related=select_related,
-            prefetch_related=prefetch_related,
-        )
-        await item.delete()
+        """
+        Один DELETE ... WHERE pk с фильтрами по умолчанию, 0 удалённых - ItemNotFound.
+        Запись загружается и удаляется через instance.delete() только если нужны сигналы
+        (fetch_before_delete или у модели есть pre_delete/post_delete)
+        """
+        if self.fetch_before_delete or has_delete_listeners(self.model):
+            item = await self.get_one(
+                item_id,
+                background_tasks=background_tasks,
+                request=request,
+                select_related=select_related,
+                prefetch_related=prefetch_related,
+            )
+            await item.delete()
+        else:
+            deleted_count = await self.get_queryset(
+                request=request,
+                select_related=(),
+                prefetch_related=(),
+            ).filter(pk=item_id).delete()
+            if not deleted_count:
+                raise ItemNotFound()
+        await self.invalidate_user_cache(self.model, [item_id])
+
+    @staticmethod
+    async def invalidate_user_cache(
+            model: Type[TORTOISE_MODEL],
+            pks: Sequence[PK],
+            m2m_fields: set[str] = None,
+    ) -> None:
+        """
+        Сбрасывает кэш пользователей для авторизации (get_user_cache), если поменялись пользователи
+        или состав прав групп, и отмечает время изменения прав. m2m_fields=None - записи удалены
+        """
+        user_cache = get_user_cache()
+        if user_cache is None or not user_cache_affected(model, m2m_fields):
+            return
+        if issubclass(model, BaseUser):
+            await user_cache.invalidate(*pks)
+        else:
+            # каких пользователей это касается, не знаем без запроса, проще сбросить всё
+            await user_cache.clear()
+        # права из уже выданных токенов больше не верны
+        await user_cache.touch_permissions_changed_at()
+
+    @staticmethod
+    def invalidate_user_cache_on_commit(
+            model: Type[TORTOISE_MODEL],
+            pks: Sequence[PK],
+            m2m_fields: set[str] = None,
+    ) -> None:
+        """
+        invalidate_user_cache после коммита внешней user_cache_transaction: до коммита параллельный запрос
+        успеет закэшировать старые данные. Вне user_cache_transaction коммит не отследить - RuntimeError,
+        если кэш пользователей надо сбрасывать
+        """
+        pending = USER_CACHE_PENDING.get()
+        if pending is not None:
+            pending.append((model, pks, m2m_fields))
+        elif get_user_cache() is not None and user_cache_affected(model, m2m_fields):
+            raise RuntimeError(
+                f'{model.__name__} changed inside a transaction without user_cache_transaction, '
+                'user cache can not be invalidated after commit'
+            )
 
     def handle_create(self, model: Type[TORTOISE_MODEL]) -> Handler:
-        if handler := self.create_handlers.get(model):
+        if handler := self.create_handlers.get(model) or self.default_create_handlers.get(model):
             return handler
 
         async def base_handler(
@@ -623,7 +1318,8 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
                 data_dict.update(defaults)
             return await model.create(**data_dict)
 
-        self.create_handlers[model] = base_handler
+        # отдельно от create_handlers, чтобы create_many отличал свои обработчики от стандартного
+        self.default_create_handlers[model] = base_handler
         return base_handler
 
     def handle_edit(self, instance: TORTOISE_MODEL) -> Handler:
@@ -640,27 +1336,76 @@ class TortoiseCRUDService(BaseCRUDService[PK, TORTOISE_MODEL]):
             data_dict = data.dict(include=include_fields, exclude_unset=True)
             if defaults is not None:
                 data_dict.update(defaults)
-            instance.update_from_dict(data_dict)
-            await instance.save(force_update=True, update_fields=list(data_dict.keys()))
+            # пишем только изменившиеся колонки, без изменений UPDATE не нужен
+            # (save с пустым update_fields обновил бы все поля)
+            if changed := get_changed_values(instance, data_dict):
+                set_values(instance, changed)
+                await instance.save(force_update=True, update_fields=list(changed.keys()))
             return instance
 
-        self.edit_handlers[model] = base_handler
+        # не кэшируем, обработчик замкнут на конкретный instance
         return base_handler
 
     async def save_m2m(self, instance: TORTOISE_MODEL, data: CamelModel, m2m_fields: set[str], clear=True) -> None:
         if not m2m_fields:
             return
+        not_found_fk: set[str] = set()
         for field_name in m2m_fields:
-            rel: ManyToManyRelation = getattr(instance, field_name)
-            ids: list[PK] = getattr(data, field_name)
-            if clear:
-                await rel.clear()
-            await rel.add(*(await rel.remote_model.filter(pk__in=ids)))
+            if not await self.sync_m2m(instance, field_name, getattr(data, field_name), clear=clear):
+                not_found_fk.add(field_name)
+        if not_found_fk:
+            raise NotFoundFK(fields=not_found_fk)
         await instance.fetch_related(*m2m_fields)
 
+    @staticmethod
+    async def sync_m2m(instance: TORTOISE_MODEL, field_name: str, ids: Sequence[PK], clear=True) -> bool:
+        """
+        Приводит связи в through таблице к ids: добавляет недостающие, удаляет лишние (clear=False - не удаляет).
+        Если каких-то ids нет в базе, ничего не меняет и возвращает False
+        """
+        field: ManyToManyFieldInstance = instance._meta.fields_map[field_name]
+        remote_pk = field.related_model._meta.pk
+        ids = {remote_pk.to_python_value(pk) for pk in ids}
+        if ids and await field.related_model.filter(pk__in=ids).count() != len(ids):
+            return False
+
+        db = instance._meta.db
+        through = Table(field.through)
+        instance_pk = instance._meta.pk.to_db_value(instance.pk, instance)
+        _, rows = await db.execute_query(str(
+            db.query_class.from_(through)
+            .where(through[field.backward_key] == instance_pk)
+            .select(field.forward_key)
+        ))
+        current = {remote_pk.to_python_value(row[field.forward_key]) for row in rows}
+
+        if to_add := ids - current:
+            query = db.query_class.into(through).columns(through[field.forward_key], through[field.backward_key])
+            for pk in to_add:
+                query = query.insert(remote_pk.to_db_value(pk, None), instance_pk)
+            await db.execute_query(str(query))
+        if clear and (to_remove := current - ids):
+            await db.execute_query(str(
+                db.query_class.from_(through)
+                .where(
+                    (through[field.backward_key] == instance_pk)
+                    & through[field.forward_key].isin([remote_pk.to_db_value(pk, None) for pk in to_remove])
+                )
+                .delete()
+            ))
+        return True
+
     def get_default_sort_fields(self) -> set[str]:
         return {*self.opts.db_fields}
 
+    def get_cursor_keys(self, sort: list[str]) -> tuple[CursorKey, ...]:
+        keys = super().get_cursor_keys(sort)
+        for key in keys:
+            # значения ключей сравниваются с колонками в get_keyset_q, аннотации и связи так не сравнить
+            if key.field not in self.opts.db_fields:
+                raise ValueError(f'Sort by {key.field} is not available for keyset pagination')
+        return keys
+
 
 def get_exclude_dict(fields: set[str]) -> dict[str, set[str]]:
     """
@@ -702,6 +1447,253 @@ def exclude_fields_from_data(data: CamelModel, *fields: str) -> set[str]:
     return return_fields
 
 
+def get_db_defaults(model: Type[BaseModel], defaults: Optional[dict[str, Any]]) -> dict[str, Any]:
+    """fk из defaults ({order: instance}) как source_field ({order_id: pk}), как они лежат в бд и в unique_together"""
+    opts = model._meta
+    db_defaults: dict[str, Any] = {}
+    for key, value in (defaults or {}).items():
+        if key in opts.fk_fields:
+            key, value = opts.fields_map[key].source_field, getattr(value, 'pk', value)
+        db_defaults[key] = value
+    return db_defaults
+
+
+def get_update_object(model: Type[BaseModel], item_id: Any, data_dict: dict[str, Any]) -> BaseModel:
+    """Объект только для bulk_update: pk и уже приведённые к значениям бд поля, без запроса записи"""
+    instance = model._init_from_db(**{model._meta.db_pk_column: item_id})
+    fields_map = model._meta.fields_map
+    for field_name, value in data_dict.items():
+        setattr(instance, field_name, fields_map[field_name].to_db_value(value, instance))
+    return instance
+
+
+@cache
+def get_schema_usage(model: Type[BaseModel], schema: Type[CamelModel]) -> tuple[frozenset[str], frozenset[str]]:
+    """
+    (связи модели, которые использует схема; поля схемы, которых нет ни среди полей бд, ни среди атрибутов модели -
+    их даёт только запрос, например аннотации)
+    """
+    opts = model._meta
+    relations: set[str] = set()
+    not_on_instance: set[str] = set()
+    for field_name in schema.__fields__:
+        if field_name in opts.fetch_fields:
+            relations.add(field_name)
+        elif field_name not in opts.db_fields and not hasattr(model, field_name):
+            not_on_instance.add(field_name)
+    return frozenset(relations), frozenset(not_on_instance)
+
+
+def get_values_fields(model: Type[BaseModel], schema: Type[CamelModel]) -> Optional[tuple[str, ...]]:
+    """
+    Поля схемы, если её можно собрать из .values(): только колонки и то, чего нет у модели (аннотации).
+    None - есть связи или property/методы модели
+    """
+    relations, not_on_instance = get_schema_usage(model, schema)
+    if relations:
+        return None
+    opts = model._meta
+    if any(name not in opts.fields_db_projection and name not in not_on_instance for name in schema.__fields__):
+        return None
+    return tuple(schema.__fields__)
+
+
+def only_relations(plan: QuerysetPlan, relations: Collection[str]) -> QuerysetPlan:
+    """plan без select/prefetch связей не из relations (items__product остаётся, если есть items)"""
+    return plan._replace(
+        select_related=tuple(p for p in plan.select_related if p.split('__', 1)[0] in relations),
+        prefetch_related=tuple(p for p in plan.prefetch_related if p.split('__', 1)[0] in relations),
+    )
+
+
+def get_sparse_columns(
+        model: Type[BaseModel],
+        fields: Collection[str],
+        annotations: Collection[str],
+) -> Optional[list[str]]:
+    """Колонки для .only() под fields, None - если какое-то поле не колонка, не связь и не аннотация"""
+    opts = model._meta
+    columns = {opts.pk_attr: None}
+    for name in fields:
+        if name in opts.fields_db_projection:
+            columns[name] = None
+        elif name in opts.fk_fields or name in opts.o2o_fields:
+            # связь загружается по <name>_id
+            columns[opts.fields_map[name].source_field] = None
+        elif name not in opts.fetch_fields and name not in annotations:
+            return None
+    return list(columns)
+
+
+def relation_fetched(instance: BaseModel, field_name: str) -> bool:
+    value = instance.__dict__.get(f'_{field_name}', NOT_FETCHED)
+    if isinstance(value, ReverseRelation):
+        return value._fetched
+    # fk и backward o2o без загрузки хранят там queryset
+    return value is not NOT_FETCHED and not inspect.isawaitable(value)
+
+
+def has_delete_listeners(model: Type[BaseModel]) -> bool:
+    return any(model._listeners[signal].get(model) for signal in (Signals.pre_delete, Signals.post_delete))
+
+
+def get_changed_values(instance: BaseModel, values: dict[str, Any]) -> dict[str, Any]:
+    """Только значения, которые отличаются от текущих у instance"""
+    fields_map = instance._meta.fields_map
+    return {
+        field_name: value for field_name, value in values.items()
+        if getattr(instance, field_name) != fields_map[field_name].to_python_value(value)
+    }
+
+
+def set_values(instance: BaseModel, values: dict[str, Any]) -> None:
+    """update_from_dict, плюс сброс загруженных связанных записей у изменившихся fk"""
+    instance.update_from_dict(values)
+    fk_map = get_fk_map(instance.__class__)
+    for source_field_name in fk_map.keys() & values.keys():
+        instance.__dict__.pop(f'_{fk_map[source_field_name][1]}', None)
+
+
+@cache
+def get_required_fields(model: Type[BaseModel]) -> tuple[str, ...]:
+    """Колонки, которые надо заполнить при создании: не null, без default, не генерируются бд и не auto_now"""
+    opts = model._meta
+    return tuple(
+        name for name in sorted(opts.db_fields)
+        if not (field := opts.fields_map[name]).null and field.default is None and not field.generated
+        and not getattr(field, 'auto_now', False) and not getattr(field, 'auto_now_add', False)
+    )
+
+
+@cache
+def get_fk_map(model: Type[BaseModel]) -> dict[str, tuple[Type[BaseModel], str]]:
+    """{source_field fk (category_id): (связанная модель, имя fk поля)}"""
+    opts = model._meta
+    return {(f_opts := opts.fields_map[f]).source_field: (f_opts.related_model, f) for f in opts.fk_fields}
+
+
+def user_cache_affected(model: Type[BaseModel], m2m_fields: Optional[set[str]]) -> bool:
+    """Меняют ли такие изменения кэш пользователей: сами пользователи или состав прав групп"""
+    if issubclass(model, BaseUser):
+        return True
+    return issubclass(model, (PermissionGroup, Permission)) and (m2m_fields is None or 'permissions' in m2m_fields)
+
+
+@asynccontextmanager
+async def user_cache_transaction():
+    """
+    in_transaction, после коммита которой выполняются отложенные внутри сбросы кэша пользователей
+    (invalidate_user_cache_on_commit). Для своих транзакций вокруг edit(inside_transaction=True).
+    Вложенная только открывает транзакцию, сбросы выполнит внешняя
+    """
+    if USER_CACHE_PENDING.get() is not None:
+        async with in_transaction():
+            yield
+        return
+    pending: list[tuple[Any, ...]] = []
+    token = USER_CACHE_PENDING.set(pending)
+    try:
+        async with in_transaction():
+            yield
+    finally:
+        USER_CACHE_PENDING.reset(token)
+    for args in pending:
+        await TortoiseCRUDService.invalidate_user_cache(*args)
+
+
+@asynccontextmanager
+async def savepoint(connection: BaseDBAsyncClient):
+    # вложенный in_transaction в tortoise откатывает всю транзакцию, поэтому savepoint вручную
+    name = f'sp_{uuid4().hex}'
+    await connection.execute_query(f'SAVEPOINT {name}')
+    try:
+        yield
+    except BaseException:
+        await connection.execute_query(f'ROLLBACK TO SAVEPOINT {name}')
+        raise
+    else:
+        await connection.execute_query(f'RELEASE SAVEPOINT {name}')
+
+
+# postgres (asyncpg): detail 'Key (title, category_id)=(x, 1) already exists.'
+PG_KEY_RE = re.compile(r'Key \((?P<columns>.+?)\)=')
+# sqlite: 'UNIQUE constraint failed: item.title, item.category_id'
+SQLITE_UNIQUE_RE = re.compile(r'UNIQUE constraint failed: (?P<columns>.+)$')
+
+
+def integrity_error_fields(model: Type[BaseModel], error: IntegrityError) -> Optional[FieldsError]:
+    """NotUnique/NotFoundFK по сообщению базы, None если поля из него не понять"""
+    original = error.args[0] if error.args else error
+    sqlstate = getattr(original, 'sqlstate', None)
+    if sqlstate in ('23505', '23503') and (match := PG_KEY_RE.match(getattr(original, 'detail', None) or '')):
+        columns = [column.strip().strip('"') for column in match['columns'].split(',')]
+        error_cls = NotUnique if sqlstate == '23505' else NotFoundFK
+    elif match := SQLITE_UNIQUE_RE.search(str(original)):
+        columns = [column.strip().rpartition('.')[2] for column in match['columns'].split(',')]
+        error_cls = NotUnique
+    else:
+        return None
+    reverse = model._meta.fields_db_projection_reverse
+    if not all(column in reverse for column in columns):
+        return None
+    return error_cls(fields=[reverse[column] for column in columns])
+
+
+def get_path_and_method(request: Optional[Request]) -> tuple[str, str]:
+    if request is None:
+        return '', ''
+    return request.scope['route'].path, request.method
+
+
+async def estimate_count(query: QuerySet) -> int:
+    """
+    Оценка количества строк по плану запроса (EXPLAIN), сам запрос не выполняется.
+    Работает только для postgres, для остальных баз честный count(*)
+    """
+    if query._choose_db().capabilities.dialect != 'postgres':
+        return await query.count()
+    rows = await query.explain()
+    plan = rows[0]['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_keyset_q(opts: MetaInfo, keys: Sequence[CursorKey], values: Sequence[Any], backward: bool = False) -> Q:
+    """
+    (a, b, pk) > (1, 2, 3) раскрывает в a > 1 OR (a = 1 AND (b > 2 OR (b = 2 AND pk > 3))),
+    для убывающего ключа (и для всех при backward) сравнение <. NULL стоят там же,
+    где их ставит ORDER BY этой бд (nulls_last_in_asc)
+    """
+    nulls_last = nulls_last_in_asc(opts)
+    q: Optional[Q] = None
+    for (key, descending), raw_value in reversed(tuple(zip(keys, values))):
+        reverse = descending != backward
+        # идём ли к NULL: по возрастанию при NULLS LAST или по убыванию при NULLS FIRST
+        nulls_after = nulls_last != reverse
+        field = opts.fields_map[key]
+        value = None if raw_value is None else field.to_python_value(raw_value)
+        if value is None:
+            equal = Q(**{f'{key}__isnull': True})
+            # после NULL идут либо только такие же NULL, либо все не NULL
+            after = None if nulls_after else Q(**{f'{key}__isnull': False})
+        else:
+            equal = Q(**{key: value})
+            after = Q(**{f'{key}__{"lt" if reverse else "gt"}': value})
+            if field.null and nulls_after:
+                after |= Q(**{f'{key}__isnull': True})
+        if q is not None:
+            after = equal & q if after is None else after | (equal & q)
+        q = after
+    # все ключи NULL и дальше только NULL - после последней записи ничего нет
+    return q if q is not None else Q(**{f'{opts.pk_attr}__isnull': True})
+
+
+def nulls_last_in_asc(opts: MetaInfo) -> bool:
+    """ORDER BY ... ASC ставит NULL в конец в postgres и oracle, в начало - в sqlite, mysql и mssql"""
+    return opts.db.capabilities.dialect in ('postgres', 'oracle')
+
+
 def get_qs_build_func(name: str, model: Type[TORTOISE_MODEL], obj: Any):
     if obj is None:
         return getattr(model, 'get_' + name)
@@ -1,7 +1,8 @@
 from collections.abc import Callable
-from typing import Any, Type, Sequence
+from typing import Any, Type, Sequence, Self, Optional
 
 from tortoise import Model as DefaultModel
+from tortoise.expressions import Q, Case, When
 
 
 class BaseModel(DefaultModel):
@@ -10,20 +11,113 @@ class BaseModel(DefaultModel):
         abstract = True
 
     @classmethod
-    async def check_unique(cls, data: dict[str, Any]) -> list[str]:
-        # TODO: self.__class__._meta.unique_together
+    async def check_unique(cls, data: dict[str, Any], instance: Self = None) -> list[str]:
+        """
+        Все unique и unique_together проверяются одним запросом, каждое ограничение - флаг через CASE.
+        instance - редактируемая запись, она не учитывается, а не изменившиеся значения не проверяются
+        """
+        checks: list[tuple[tuple[str, ...], Q]] = []
+        for keys in cls.get_unique_constraints():
+            if not any(key in data for key in keys):
+                continue
+            values = {key: data[key] if key in data else getattr(instance, key, None) for key in keys}
+            if any(value is None for value in values.values()):
+                continue
+            if instance is not None and all(getattr(instance, key) == value for key, value in values.items()):
+                continue
+            checks.append((keys, Q(**values)))
+        if not checks:
+            return []
+
+        query = cls.filter(Q(*(q for _, q in checks), join_type=Q.OR))
+        if instance is not None:
+            query = query.exclude(pk=instance.pk)
+        flags = {f'_unique_{i}': Case(When(q, then=1), default=0) for i, (_, q) in enumerate(checks)}
+        rows = await query.annotate(**flags).limit(len(checks)).values(*flags)
         not_unique = []
-        query = cls.all()
-        for key, value in cls._meta.fields_map.items():
-            if (
-                    not value.generated
-                    and value.unique
-                    and (current_value := data.get(key)) is not None
-            ):
-                if await query.filter(**{key: current_value}).exists():
-                    not_unique.append(key)
+        for i, (keys, _) in enumerate(checks):
+            if any(row[f'_unique_{i}'] for row in rows):
+                not_unique.extend(key for key in keys if key not in not_unique)
         return not_unique
 
+    @classmethod
+    async def check_unique_many(
+            cls,
+            items: list[dict[str, Any]],
+            chunk_size: int = 500,
+            current: list[Optional[dict[str, Any]]] = None,
+    ) -> list[list[str]]:
+        """
+        check_unique для пачки записей: запрос на ограничение (и на каждые chunk_size значений),
+        а не на запись. Повторы внутри пачки тоже ошибка, у всех вхождений кроме первого.
+        current - текущие значения (pk и поля ограничений) редактируемых записей, None - записи нет, не проверяем
+        """
+        not_unique: list[list[str]] = [[] for _ in items]
+        fields_map = cls._meta.fields_map
+        pk_attr = cls._meta.pk_attr
+        for keys in cls.get_unique_constraints():
+            by_value: dict[tuple[Any, ...], list[int]] = {}
+            for i, data in enumerate(items):
+                if current is None:
+                    values = tuple(data.get(key) for key in keys)
+                else:
+                    if current[i] is None or not any(key in data for key in keys):
+                        continue
+                    values = tuple(data[key] if key in data else current[i][key] for key in keys)
+                if any(value is None for value in values):
+                    continue
+                values = tuple(fields_map[key].to_python_value(value) for key, value in zip(keys, values))
+                if current is not None and values == tuple(
+                        fields_map[key].to_python_value(current[i][key]) for key in keys
+                ):
+                    continue
+                by_value.setdefault(values, []).append(i)
+            if not by_value:
+                continue
+            colliding: dict[tuple[Any, ...], set[Any]] = {}
+            all_values = list(by_value)
+            for start in range(0, len(all_values), chunk_size):
+                chunk = all_values[start:start + chunk_size]
+                if len(keys) == 1:
+                    query = cls.filter(**{f'{keys[0]}__in': [values[0] for values in chunk]})
+                else:
+                    query = cls.filter(Q(*(Q(**dict(zip(keys, values))) for values in chunk), join_type=Q.OR))
+                for pk, *row in await query.values_list(pk_attr, *keys):
+                    values = tuple(fields_map[key].to_python_value(value) for key, value in zip(keys, row))
+                    colliding.setdefault(values, set()).add(pk)
+            for values, indexes in by_value.items():
+                for n, i in enumerate(indexes):
+                    own_pk = current[i][pk_attr] if current is not None else None
+                    if n or colliding.get(values, set()).difference({own_pk}):
+                        not_unique[i].extend(key for key in keys if key not in not_unique[i])
+        return not_unique
+
+    @classmethod
+    def get_unique_constraints(cls) -> list[tuple[str, ...]]:
+        """unique поля и unique_together, fk в unique_together по source_field (category -> category_id)"""
+        opts = cls._meta
+        constraints: list[tuple[str, ...]] = [
+            (key, ) for key, field in opts.fields_map.items()
+            if not field.generated and field.unique
+        ]
+        for together in opts.unique_together:
+            constraints.append(tuple(
+                opts.fields_map[key].source_field if key in opts.fk_fields else key for key in together
+            ))
+        return constraints
+
+    def db_values(self) -> dict[str, Any]:
+        return {field_name: getattr(self, field_name) for field_name in self._meta.fields_db_projection}
+
+    @classmethod
+    def from_db_values(cls, values: dict[str, Any]) -> Self:
+        """Обратное к db_values, значения могут быть и сериализованными (например из json)"""
+        meta = cls._meta
+        return cls._init_from_db(**{
+            meta.fields_db_projection[field_name]: meta.fields_map[field_name].to_python_value(value)
+            for field_name, value in values.items()
+        })
+
     @classmethod
     def get_queryset_select_related(cls, path: str, method: str) -> set[str]:
         return set()
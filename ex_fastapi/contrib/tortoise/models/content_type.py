@@ -10,6 +10,7 @@ class ContentType(BaseModel):
     name: str = fields.CharField(max_length=50, unique=True)
     instances_by_id: dict[int, Self] = {}
     instances_by_name: dict[str, Self] = {}
+    permission_ids: dict[str, int] = {}  # {имя права: id}, у каждого экземпляра свой из check_permissions
 
     class Meta:
         table = "content_types"
@@ -21,3 +22,6 @@ class ContentType(BaseModel):
     @classmethod
     def get_by_name(cls, _name: str) -> Self:
         return cls.instances_by_name[_name]
+
+    def get_permission_id(self, name: str) -> int:
+        return self.permission_ids[name]
@@ -1,16 +1,17 @@
+from functools import cached_property
 from random import choices
 from string import hexdigits
-from typing import Type, TypeVar, Literal, TYPE_CHECKING, Any
+from typing import Type, TypeVar, Literal, TYPE_CHECKING, Any, Self, Optional
 from uuid import UUID
 
 from fastapi import BackgroundTasks
-from passlib.context import CryptContext
 from tortoise import timezone
 
-from ex_fastapi.global_objects import get_user_model
+from ex_fastapi.global_objects import get_user_model, get_user_cache
 from ex_fastapi.auth.base_repository import BaseUserRepository
+from ex_fastapi.auth.permission_claims import permissions_mask, mask_has_permissions
 from ex_fastapi.schemas import PasswordsPair
-from ex_fastapi.models import UserWithPermissions, ContentType, max_len_of, BaseModel
+from ex_fastapi.models import UserWithPermissions, ContentType, max_len_of, BaseModel, Permission, PermissionGroup
 
 if TYPE_CHECKING:
     from ex_fastapi.auth.config import Token
@@ -25,7 +26,6 @@ User: Type[USER_MODEL]
 class UserRepository(BaseUserRepository[USER_MODEL]):
     model: Type[USER_MODEL] = User
     user: USER_MODEL
-    pwd_context = CryptContext(schemes=["md5_crypt"])
 
     @classmethod
     async def create_user(
@@ -38,7 +38,7 @@ class UserRepository(BaseUserRepository[USER_MODEL]):
         if defaults:
             data_dict.update(defaults)
         self = cls(cls.model(**data_dict))
-        self.set_password(data.password)
+        await self.set_password(data.password)
         await self.save(force_create=True)
         return self.user
 
@@ -73,27 +73,38 @@ class UserRepository(BaseUserRepository[USER_MODEL]):
         await self.user.temp_code.delete()
         await self.save(force_update=True)
 
-    def set_password(self, password: str) -> None:
+    async def set_password(self, password: str) -> None:
         user = self.user
         user.password_change_dt = timezone.now()
         user.password_salt = ''.join(choices(hexdigits, k=max_len_of(self.model)('password_salt')))
         if password:
-            user.password_hash = self.get_password_hash(password)
+            user.password_hash = await self.get_password_hash(password)
         else:
-            user.password_hash = UNUSED_PASSWORD_PREFIX + self.get_password_hash(''.join(choices(hexdigits, k=30)))
+            unused_password = ''.join(choices(hexdigits, k=30))
+            user.password_hash = UNUSED_PASSWORD_PREFIX + await self.get_password_hash(unused_password)
 
     def get_fake_password(self, password: str) -> str:
         user = self.user
         return password + str(user.password_change_dt.timestamp()) + user.password_salt
 
-    def verify_password(self, password: str) -> bool:
-        if self.user.password_hash.startswith(UNUSED_PASSWORD_PREFIX):
+    async def verify_password(self, password: str) -> bool:
+        user = self.user
+        if user.password_hash.startswith(UNUSED_PASSWORD_PREFIX):
             return False
-        return self.pwd_context.verify(self.get_fake_password(password), self.user.password_hash)
-
-    @property
-    def save(self):
-        return self.user.save
+        valid, new_hash = await self.password_hasher.verify_and_update(
+            self.get_fake_password(password), user.password_hash
+        )
+        if valid and new_hash is not None:
+            # password_change_dt не трогаем, иначе выданные токены станут недействительны
+            user.password_hash = new_hash
+            await self.save(update_fields=['password_hash'])
+        return valid
+
+    async def save(self, **kwargs) -> None:
+        await self.user.save(**kwargs)
+        # активность и пароль проверяются по кэшу, старая запись пропустила бы отключённого пользователя
+        if (user_cache := get_user_cache()) is not None:
+            await user_cache.invalidate(self.user.pk)
 
     def can_login(self) -> bool:
         return self.is_user_active
@@ -105,16 +116,49 @@ class UserRepository(BaseUserRepository[USER_MODEL]):
         return tuple((perm.content_type_id, perm.name) for perm in self.user.all_permissions)
 
     def has_permissions(self, permissions: tuple[tuple[Type[BaseModel], str], ...]) -> bool:
-        if not permissions:
-            return True
-        user_perms = self.get_permissions()
-        has = True
+        return self.has_permissions_mask(self.get_required_permissions_mask(permissions))
+
+    @cached_property
+    def permissions_mask(self) -> int:
+        # all_permissions собирает множество по всем группам, поэтому считаем один раз на загрузку пользователя
+        return permissions_mask(perm.id for perm in self.user.all_permissions)
+
+    @classmethod
+    def get_required_permissions_mask(cls, permissions: tuple[tuple[Type[BaseModel], str], ...]) -> Optional[int]:
+        permission_ids = []
         for model, perm_name in permissions:
-            content_type_id = ContentType.get_by_name(model.__name__).id
-            if (content_type_id, perm_name) not in user_perms:
-                has = False
-                break
-        return has
+            content_type = ContentType.get_by_name(model.__name__)
+            if perm_name not in content_type.permission_ids:
+                return None
+            permission_ids.append(content_type.get_permission_id(perm_name))
+        return permissions_mask(permission_ids)
+
+    def has_permissions_mask(self, required: Optional[int]) -> bool:
+        return required is not None and mask_has_permissions(self.permissions_mask, required)
+
+    def dump_cache(self) -> dict[str, Any]:
+        user = self.user
+        return {
+            'user': user.db_values(),
+            'permissions': [p.db_values() for p in user.permissions],
+            'groups': [
+                {'group': g.db_values(), 'permissions': [p.db_values() for p in g.permissions]}
+                for g in user.groups
+            ],
+        }
+
+    @classmethod
+    def load_cache(cls, data: dict[str, Any]) -> Self:
+        # собираем то же, что даёт get_one с prefetch permissions и groups__permissions
+        user = cls.model.from_db_values(data['user'])
+        user.permissions._set_result_for_query([Permission.from_db_values(p) for p in data['permissions']])
+        groups = []
+        for group_data in data['groups']:
+            group = PermissionGroup.from_db_values(group_data['group'])
+            group.permissions._set_result_for_query([Permission.from_db_values(p) for p in group_data['permissions']])
+            groups.append(group)
+        user.groups._set_result_for_query(groups)
+        return cls(user)
 
     async def update_or_create_temp_code(self) -> None:
         temp_code, created = await self.user.temp_code.model.get_or_create(user=self.user)
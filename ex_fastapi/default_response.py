@@ -2,17 +2,23 @@ import json
 from typing import Any, Optional
 
 from fastapi import HTTPException, BackgroundTasks
+from pydantic.json import pydantic_encoder
 from starlette.responses import JSONResponse
 
 from ex_fastapi.pydantic import CamelModel
 
 
+def json_default(o: Any) -> Any:
+    """Всё, что encoder не умеет сам: json_encoders CamelModel, потом как в ответах FastAPI (Decimal, BaseModel...)"""
+    for data_type, encoder in CamelModel.Config.json_encoders.items():
+        if isinstance(o, data_type):
+            return encoder(o)
+    return pydantic_encoder(o)
+
+
 class DefaultJSONEncoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:
-        for data_type, encoder in CamelModel.Config.json_encoders.items():
-            if isinstance(o, data_type):
-                return encoder(o)
-        return super().default(o)
+        return json_default(o)
 
 
 _default_encoder = DefaultJSONEncoder(
@@ -22,10 +28,22 @@ _default_encoder = DefaultJSONEncoder(
     separators=(",", ":"),
 )
 
+try:
+    import orjson
+
+    # UUID, datetime, Enum, dataclass orjson пишет сам, ключи int (loc в ошибках валидации) -> str, как у json
+    _orjson_options = orjson.OPT_NON_STR_KEYS
+
+    def render_json(content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=_orjson_options)
+except ImportError:
+    def render_json(content: Any) -> bytes:
+        return _default_encoder.encode(content).encode("utf-8")
+
 
 class DefaultJSONResponse(JSONResponse):
     def render(self, content: Any) -> bytes:
-        return _default_encoder.encode(content).encode("utf-8")
+        return render_json(content)
 
 
 class BgHTTPException(HTTPException):
@@ -9,6 +9,8 @@ if TYPE_CHECKING:
     from ex_fastapi.auth.base_repository import BaseUserRepository, UserInterface
     from ex_fastapi.auth.consumer import AuthConsumer
     from ex_fastapi.auth.provider import AuthProvider
+    from ex_fastapi.auth.user_cache import BaseUserCache
+    from ex_fastapi.auth.password import PasswordHasher
     from ex_fastapi.routers import BaseCRUDService
     from ex_fastapi.code_responces import DefaultCodes, BaseCodes, AuthErrors
 
@@ -92,9 +94,14 @@ def get_auth_consumer() -> "AuthConsumer":
         else:
             from ex_fastapi.auth.consumer import AuthConsumer
             user_auth_strategy = get_settings('AUTH_STRATEGY', default={})
+            settings_obj = get_settings_obj()
             AUTH_CONSUMER = AuthConsumer(
-                public_key=get_settings_obj().RSA_PUBLIC,
+                public_key=settings_obj.RSA_PUBLIC,
                 strategy=user_auth_strategy,
+                token_cache_size=get_settings('TOKEN_CACHE_SIZE', default=1024),
+                algorithm=settings_obj.JWT_ALGORITHM,
+                kid=settings_obj.JWT_KID,
+                previous_keys=settings_obj.JWT_PREVIOUS_KEYS,
             )
     return AUTH_CONSUMER
 
@@ -116,6 +123,46 @@ def get_auth_provider() -> "AuthProvider":
                 lifetime={
                     TokenTypes.access: settings_obj.access_token_lifetime,
                     TokenTypes.refresh: settings_obj.refresh_token_lifetime,
-                }
+                },
+                permission_claims=get_settings('PERMISSIONS_IN_TOKEN', default=False),
+                algorithm=settings_obj.JWT_ALGORITHM,
+                kid=settings_obj.JWT_KID,
             )
     return AUTH_PROVIDER
+
+
+USER_CACHE: Optional["BaseUserCache"] = None
+USER_CACHE_LOADED: bool = False
+
+
+def get_user_cache() -> Optional["BaseUserCache"]:
+    """Кэш пользователей для авторизации, по умолчанию выключен. В settings.USER_CACHE путь до объекта кэша"""
+    global USER_CACHE, USER_CACHE_LOADED
+    if not USER_CACHE_LOADED:
+        user_cache_str = get_settings('USER_CACHE', default=None)
+        if user_cache_str:
+            USER_CACHE = import_string(user_cache_str)
+        USER_CACHE_LOADED = True
+    return USER_CACHE
+
+
+PASSWORD_HASHER: Optional["PasswordHasher"] = None
+
+
+def get_password_hasher() -> "PasswordHasher":
+    """
+    settings.PASSWORD_HASHER - путь до своего объекта, иначе собирается из
+    PASSWORD_SCHEMES (первая - для новых хэшей, остальные устаревшие) и PASSWORD_HASH_WORKERS
+    """
+    global PASSWORD_HASHER
+    if PASSWORD_HASHER is None:
+        password_hasher_str = get_settings('PASSWORD_HASHER', default=None)
+        if password_hasher_str:
+            PASSWORD_HASHER = import_string(password_hasher_str)
+        else:
+            from ex_fastapi.auth.password import PasswordHasher
+            PASSWORD_HASHER = PasswordHasher(
+                schemes=get_settings('PASSWORD_SCHEMES', default=('md5_crypt', )),
+                max_workers=get_settings('PASSWORD_HASH_WORKERS', default=None),
+            )
+    return PASSWORD_HASHER
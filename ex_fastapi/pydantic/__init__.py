@@ -1,3 +1,4 @@
 from .camel_model import lower_camel, snake_case, CamelModel, CamelModelORM, GenericModel
 from .comma_separated import CommaSeparatedOf
 from .fields import *
+from .serializer import compile_serializer, sparse_serializer, serializes_by_field
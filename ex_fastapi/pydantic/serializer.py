@@ -0,0 +1,169 @@
+from collections.abc import Callable, Collection
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from functools import cache
+from typing import Any, Type, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import ModelField, SHAPE_SINGLETON, SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_ITERABLE, \
+    SHAPE_TUPLE_ELLIPSIS, SHAPE_FROZENSET
+from tortoise.exceptions import NoValuesFetched
+
+from .fields.related_list import _Related
+from .fields.field_in_related_model import _FieldInRelatedModelInstance
+
+__all__ = ['compile_serializer', 'sparse_serializer', 'serializes_by_field', 'Serializer']
+
+Serializer = Callable[[Any], dict[str, Any]]
+GETTER = tuple[str, str, bool, Any, Callable[[Any], Any]]
+
+# значения этих типов отдаются как есть, в json их переводит encoder ответа
+PASSTHROUGH_TYPES = (int, float, str, bool, UUID, datetime, date, time, timedelta, Decimal)
+SEQUENCE_SHAPES = (SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_ITERABLE, SHAPE_TUPLE_ELLIPSIS, SHAPE_FROZENSET)
+
+
+@cache
+def compile_serializer(schema: Type[BaseModel]) -> Serializer:
+    """
+    Функция объект ORM (или dict из .values()) -> dict по схеме (ключи - alias, как в ответе FastAPI),
+    без from_orm и повторной валидации.
+    Простые поля копируются как есть, если тип значения совпадает с типом поля, вложенные схемы, списки, RelatedList
+    и FieldInRelatedModel разбираются заранее. Остальное (свои типы, validator'ы) валидируется самим полем,
+    схемы с root_validator - через from_orm целиком, так что результат тот же, что у from_orm(...).dict(by_alias=True)
+    """
+    getters = get_getters(schema)
+    if getters is None:
+        return lambda obj: to_jsonable(validate_whole(schema, obj))
+    return make_serializer(getters)
+
+
+def sparse_serializer(schema: Type[BaseModel], fields: Collection[str]) -> Serializer:
+    """
+    compile_serializer только для полей fields (имена полей схемы), остальных ключей в результате нет.
+    Не кэшируется, наборов полей может быть сколько угодно, но getters берутся уже готовые.
+    Если схема не serializes_by_field, obj нужен целиком, как для from_orm
+    """
+    getters = get_getters(schema)
+    if getters is None:
+        aliases = {schema.__fields__[name].alias for name in fields}
+        return lambda obj: {
+            key: value for key, value in to_jsonable(validate_whole(schema, obj)).items() if key in aliases
+        }
+    return make_serializer([getter for getter in getters if getter[1] in fields])
+
+
+def serializes_by_field(schema: Type[BaseModel]) -> bool:
+    """Каждое поле сериализуется отдельно, для части полей хватает части объекта"""
+    return get_getters(schema) is not None
+
+
+@cache
+def get_getters(schema: Type[BaseModel]) -> Optional[list[GETTER]]:
+    """(alias, name, required, default, convert) для каждого поля, None - схему можно разобрать только from_orm"""
+    if schema.__pre_root_validators__ or schema.__post_root_validators__ or any(
+            field.field_info.exclude or field.field_info.include for field in schema.__fields__.values()
+    ):
+        return None
+    return [
+        (field.alias, field.name, field.required, field.get_default(), compile_field(schema, field))
+        for field in schema.__fields__.values()
+    ]
+
+
+def make_serializer(getters: list[GETTER]) -> Serializer:
+    def serialize(obj: Any) -> dict[str, Any]:
+        if type(obj) is dict:
+            # строки из .values()
+            return {
+                alias: convert(obj[name] if required else obj.get(name, default))
+                for alias, name, required, default, convert in getters
+            }
+        return {
+            alias: convert(getattr(obj, name) if required else getattr(obj, name, default))
+            for alias, name, required, default, convert in getters
+        }
+
+    return serialize
+
+
+def validate_whole(schema: Type[BaseModel], obj: Any) -> BaseModel:
+    if type(obj) is dict:
+        return schema.parse_obj(obj)
+    return schema.from_orm(obj)
+
+
+def compile_field(schema: Type[BaseModel], field: ModelField) -> Callable[[Any], Any]:
+    validate = field_validator(schema, field)
+    if field.class_validators:
+        return validate
+    allow_none = field.allow_none
+    if field.shape == SHAPE_SINGLETON and not field.pre_validators and not field.post_validators:
+        convert = compile_singleton(schema, field.type_, validate)
+    elif field.shape in SEQUENCE_SHAPES and field.sub_fields and not field.post_validators and all(
+            getattr(v, '__self__', None) is not None and issubclass(v.__self__, _Related)
+            for v in field.pre_validators or ()
+    ):
+        convert_item = compile_field(schema, field.sub_fields[0])
+
+        def convert(value):
+            try:
+                return [convert_item(item) for item in value]
+            except (NoValuesFetched, TypeError):
+                # не загруженная связь или не iterable - ошибка как у from_orm
+                return validate(value)
+    else:
+        return validate
+
+    if allow_none:
+        return lambda value: None if value is None else convert(value)
+    return convert
+
+
+def compile_singleton(schema: Type[BaseModel], type_: Any, validate: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    if type_ is Any:
+        return lambda value: value
+    if isinstance(type_, type):
+        if issubclass(type_, BaseModel) and type_.__config__.orm_mode:
+            # лениво, схема может ссылаться на себя (деревья)
+            return lambda value: compile_serializer(type_)(value)
+        if issubclass(type_, _FieldInRelatedModelInstance):
+            related, field_name, value_type = type_._related, type_._field, type_._type
+
+            def convert_related(value):
+                if isinstance(value, related) and isinstance(field_value := getattr(value, field_name), value_type):
+                    return field_value
+                return validate(value)
+
+            return convert_related
+        if issubclass(type_, Enum) or type_ in PASSTHROUGH_TYPES:
+            strip = type_ is str and schema.__config__.anystr_strip_whitespace
+
+            def convert_simple(value):
+                if type(value) is type_:
+                    return value.strip() if strip else value
+                return validate(value)
+
+            return convert_simple
+    return validate
+
+
+def field_validator(schema: Type[BaseModel], field: ModelField) -> Callable[[Any], Any]:
+    """Полная валидация поля, как при from_orm, с ошибкой ValidationError"""
+
+    def validate(value):
+        value, errors = field.validate(value, {}, loc=field.alias, cls=schema)
+        if errors:
+            raise ValidationError([errors], schema)
+        return to_jsonable(value)
+
+    return validate
+
+
+def to_jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.dict(by_alias=True)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [to_jsonable(item) for item in value]
+    return value
@@ -1,14 +1,28 @@
-from typing import Type, Any, TypeVar, Generic, Optional, Protocol, Callable, Sequence
+from collections.abc import AsyncIterator
+from typing import Type, Any, TypeVar, Generic, Optional, Protocol, Callable, Sequence, Literal, NamedTuple
 from uuid import UUID
 
 from fastapi import BackgroundTasks, Request
 
 from ex_fastapi.pydantic import CamelModel
+from ex_fastapi.caching import LRUCache, TTLCache
 from ex_fastapi.auth.dependencies import user_with_perms
 from .filters import BaseFilter
+from .cursor import Cursor, CursorKey
 
 PK = TypeVar('PK', int, UUID)
 DB_MODEL = TypeVar('DB_MODEL')
+# exact - count(*), none - не считаем, estimate - оценка планировщика, cached - count(*) с кэшем по набору фильтров
+COUNT_STRATEGY = Literal['exact', 'none', 'estimate', 'cached']
+# как get_all достаёт страницу и количество: sequential - по очереди в одной транзакции,
+# gather - одновременно на разных соединениях, window - одним запросом с COUNT(*) OVER()
+LIST_QUERY_MODE = Literal['sequential', 'gather', 'window']
+# что create/edit возвращают: full - запись заново через get_one со всеми связями,
+# auto - повторный запрос только если read_schema не хватает загруженного, minimal - запись как есть после записи
+REPRESENTATION = Literal['full', 'auto', 'minimal']
+# как get_all достаёт записи: models - объекты модели, values - dict'ы из .values() только с колонками
+# list_item_schema, если схеме не нужны связи и property (иначе всё равно models)
+READ_MODE = Literal['models', 'values']
 
 
 class Handler(Protocol):
@@ -32,6 +46,17 @@ class QsDefaultFiltersFunc(Protocol):
     def __call__(self, path: str, method: str) -> dict[str, Any]: ...
 
 
+class QuerysetPlan(NamedTuple):
+    """Неизменяемое описание запроса для роута, по нему каждый раз строится новый queryset"""
+    default_filters: tuple[tuple[str, Any], ...]
+    annotate_fields: tuple[tuple[str, Any], ...]
+    select_related: tuple[str, ...]
+    prefetch_related: tuple[str, ...]
+
+
+QUERYSET_PLAN_KEY = tuple[str, str, tuple[str, ...], tuple[str, ...]]
+
+
 class BaseCRUDService(Generic[PK, DB_MODEL]):
     model: Type[DB_MODEL]
 
@@ -52,6 +77,12 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
     create_handlers: dict[Type[DB_MODEL], Handler]
     edit_handlers: dict[Type[DB_MODEL], Handler]
 
+    count_cache: TTLCache[tuple, int]
+    queryset_plan_cache: LRUCache[QUERYSET_PLAN_KEY, QuerysetPlan]
+    list_query_mode: LIST_QUERY_MODE
+    read_mode: READ_MODE
+    stateless_permissions: bool
+
     def __init__(
             self,
             db_model: Type[DB_MODEL],
@@ -67,24 +98,42 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
             node_key: str = 'parent_id',
             create_handlers: dict[Type[DB_MODEL], Handler] = None,
             edit_handlers: dict[Type[DB_MODEL], Handler] = None,
+            count_cache_ttl: float = 60,
+            list_query_mode: LIST_QUERY_MODE = 'sequential',
+            queryset_plan_cache_size: int = 1000,
+            read_mode: READ_MODE = 'models',
+            stateless_permissions: bool = False,
     ) -> None:
         ...
 
-    # Смотри в tortoise-orm сервисе, используется lru_cache
-    def _get_queryset(
+    def get_queryset_plan(
             self,
             path: str,
             method: str,
-            select_related: str,
-            prefetch_related: str,
-    ) -> Any:
-        raise NotImplementedError()
+            select_related: Sequence[str],
+            prefetch_related: Sequence[str],
+    ) -> QuerysetPlan:
+        key = (path, method, tuple(select_related), tuple(prefetch_related))
+        plan = self.queryset_plan_cache.get(key)
+        if plan is None:
+            plan = QuerysetPlan(
+                default_filters=tuple(self.queryset_default_filters(path, method).items()),
+                annotate_fields=tuple(self.queryset_annotate_fields(path, method).items()),
+                select_related=tuple({*self.queryset_select_related(path, method), *select_related}),
+                prefetch_related=tuple({*self.queryset_prefetch_related(path, method), *prefetch_related}),
+            )
+            self.queryset_plan_cache.set(key, plan)
+        return plan
+
+    def queryset_plan_cache_info(self) -> dict[str, int]:
+        return self.queryset_plan_cache.info()
 
     def get_queryset(
             self,
             request: Request,
             select_related: Sequence[str],
             prefetch_related: Sequence[str],
+            fields: Sequence[str] = None,
     ):
         raise NotImplementedError()
 
@@ -103,16 +152,57 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
     async def get_all(
             self,
             skip: Optional[int], limit: Optional[int],
-            sort: set[str],
+            sort: list[str],
             filters: list[BaseFilter],
             *,
             background_tasks: BackgroundTasks = None,
             request: Request = None,
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
-    ) -> tuple[list[DB_MODEL], int]:
+            count_strategy: COUNT_STRATEGY = 'exact',
+            fields: Sequence[str] = None,
+    ) -> tuple[list[DB_MODEL], Optional[int]]:
+        """fields - поля схемы, которые нужны в ответе (None - все), остальное можно не загружать"""
+        raise NotImplementedError()
+
+    async def get_all_by_cursor(
+            self,
+            cursor: Optional[Cursor], limit: Optional[int],
+            sort: list[str],
+            filters: list[BaseFilter],
+            *,
+            background_tasks: BackgroundTasks = None,
+            request: Request = None,
+            select_related: Sequence[str] = (),
+            prefetch_related: Sequence[str] = (),
+            count_strategy: COUNT_STRATEGY = 'exact',
+            fields: Sequence[str] = None,
+    ) -> tuple[list[DB_MODEL], Optional[int], Optional[Cursor], Optional[Cursor]]:
+        """Возвращает записи, общее количество и курсоры на следующую и предыдущую страницы"""
+        raise NotImplementedError()
+
+    def export(
+            self,
+            sort: list[str],
+            filters: list[BaseFilter],
+            *,
+            request: Request = None,
+            select_related: Sequence[str] = (),
+            prefetch_related: Sequence[str] = (),
+            fields: Sequence[str] = None,
+            batch_size: int = 1000,
+    ) -> AsyncIterator[list[DB_MODEL]]:
+        """Все записи по фильтрам пачками по batch_size, без count и offset"""
         raise NotImplementedError()
 
+    def get_cursor_keys(self, sort: list[str]) -> tuple[CursorKey, ...]:
+        """ValueError, если поле сортировки не годится для keyset (не колонка модели)"""
+        keys = tuple(CursorKey.parse(name) for name in sort)
+        # pk в конце делает порядок однозначным
+        if any(key.field == self.pk_attr for key in keys):
+            return keys
+        return *keys, CursorKey(self.pk_attr)
+
     async def get_many(
             self,
             item_ids: list[PK],
@@ -157,9 +247,21 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
             defaults: dict[str, Any] = None,
             request: Request = None,
             inside_transaction: bool = False,
+            representation: REPRESENTATION = 'full',
     ) -> DB_MODEL:
         raise NotImplementedError()
 
+    async def create_many(
+            self,
+            items: list[CamelModel],
+            *,
+            background_tasks: BackgroundTasks = None,
+            defaults: dict[str, Any] = None,
+            request: Request = None,
+            chunk_size: int = 500,
+    ) -> int:
+        raise NotImplementedError()
+
     async def edit(
             self,
             item_id_or_instance: PK | DB_MODEL,
@@ -172,9 +274,22 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
             select_related: Sequence[str] = (),
             prefetch_related: Sequence[str] = (),
             inside_transaction: bool = False,
+            representation: REPRESENTATION = 'full',
     ) -> DB_MODEL:
         raise NotImplementedError()
 
+    async def edit_many(
+            self,
+            item_ids: Sequence[PK],
+            data: CamelModel | Sequence[CamelModel],
+            *,
+            background_tasks: BackgroundTasks = None,
+            defaults: dict[str, Any] = None,
+            request: Request = None,
+            chunk_size: int = 500,
+    ) -> int:
+        raise NotImplementedError()
+
     async def delete_many(
             self,
             item_ids: list[PK],
@@ -201,7 +316,7 @@ class BaseCRUDService(Generic[PK, DB_MODEL]):
         raise NotImplementedError()
 
     def has_permissions(self, name: str) -> Callable[[...], bool]:
-        return user_with_perms((self.model, name))
+        return user_with_perms((self.model, name), stateless=self.stateless_permissions)
 
     def has_create_permissions(self) -> Callable[[...], bool]:
         return self.has_permissions('create')
@@ -1,35 +1,53 @@
-from collections.abc import Sequence
+from collections.abc import Sequence, Iterable
 from enum import Enum
-from typing import Callable, Any, Generic, TypeVar, Optional, Type
+from typing import Callable, Any, Generic, TypeVar, Optional, Type, Literal
 
 from fastapi import Response, Request, APIRouter, Body, Path, Query, params, Depends, BackgroundTasks
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import conlist, create_model
 from pydantic.error_wrappers import ErrorWrapper
 
-from ex_fastapi import BaseCodes, snake_case, CommaSeparatedOf, lower_camel
+from ex_fastapi import CamelModel, BaseCodes, snake_case, CommaSeparatedOf, lower_camel
+from ex_fastapi.pydantic.serializer import compile_serializer, sparse_serializer, serializes_by_field
 from ex_fastapi.global_objects import get_default_codes
-from ex_fastapi.default_response import BgHTTPException
+from ex_fastapi.settings import get_settings_obj
+from ex_fastapi.default_response import BgHTTPException, DefaultJSONResponse
 from . import BaseCRUDService
+from .base_crud_service import COUNT_STRATEGY
+from .cursor import Cursor, CursorKey, InvalidCursor
 from .exceptions import ItemNotFound, FieldErrors, MultipleFieldsError
+from .export import EXPORT_FORMAT, EXPORT_MEDIA_TYPES, ndjson_stream, csv_stream
 from .filters import BaseFilter
-from .utils import pagination_factory, PAGINATION, get_filters, sort_factory
+from .utils import pagination_factory, PAGINATION, get_filters, sort_factory, \
+    cursor_pagination_factory, CURSOR_PAGINATION, fields_factory
 
 DISPLAY_FIELDS = tuple[str, ...]
 SERVICE = TypeVar('SERVICE', bound=BaseCRUDService)
 DEPENDENCIES = Optional[Sequence[params.Depends]]
 ROUTES_KWARGS = dict[str, bool | dict[str, Any]]
+PAGINATION_MODE = Literal['offset', 'cursor']
+RESPONSE = TypeVar('RESPONSE', bound=Response)
 
 Codes = get_default_codes()
+MINIMAL_HEADERS = {'Preference-Applied': 'return=minimal'}
 
 
 class CRUDRouter(Generic[SERVICE], APIRouter):
     service: SERVICE
     max_items_get_many_routes: Optional[int]
     max_items_delete_many_routes: Optional[int]
+    max_items_create_many_routes: Optional[int]
+    max_items_edit_many_routes: Optional[int]
     filters: list[Type[BaseFilter]]
     available_sort: set[str]
     max_page_size: int | None
+    pagination: PAGINATION_MODE
+    count_strategy: COUNT_STRATEGY
     auto_routes_dependencies: DEPENDENCIES
+    return_representation: bool
+    precompiled_serializers: bool
+    export_batch_size: int
 
     def __init__(
             self,
@@ -37,14 +55,23 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
             *,
             max_items_get_many: int = 100,
             max_items_delete_many: int = 100,
+            max_items_create_many: int = 1000,
+            max_items_edit_many: int = 1000,
             prefix: str = None,
             tags: Optional[list[str | Enum]] = None,
             filters: list[Type[BaseFilter]] = None,
             available_sort: set[str] = None,
             max_page_size: int | None = 100,
+            pagination: PAGINATION_MODE = 'offset',
+            count_strategy: COUNT_STRATEGY = 'exact',
+            return_representation: bool = True,
+            precompiled_serializers: bool = True,
             auto_routes_dependencies: DEPENDENCIES = None,
             routes_kwargs: ROUTES_KWARGS = None,
             add_tree_routes: bool = False,
+            add_export_route: bool = False,
+            add_bulk_routes: bool = False,
+            export_batch_size: int = 1000,
             read_only: bool = False,
             routes_only: set[str] = None,
             complete_auto_routes: bool = True,
@@ -53,16 +80,37 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
         """
             :param max_items_get_many         отпределяет маскимальное количество записей, которые достаются по id
             :param max_items_delete_many      отпределяет маскимальное количество записей, которые удаляются по id
+            :param max_items_create_many      отпределяет маскимальное количество записей, которые создаются за раз
+            :param max_items_edit_many        отпределяет маскимальное количество записей, которые редактируются за раз
             :param prefix                     префикс из APIRouter
             :param tags                       tags из APIRouter
             :param filters                    фильтры для get_all
             :param available_sort             поля для сортировки для get_all
+            :param pagination                 offset - skip/limit, cursor - keyset пагинация по подписанному курсору
+                                              из заголовков X-Next-Cursor/X-Prev-Cursor, стоимость страницы
+                                              не зависит от её номера
+            :param count_strategy             как считать X-Total-Count для get_all: exact - count(*),
+                                              none - не считать и не отдавать заголовок, estimate - оценка
+                                              планировщика postgres, cached - count(*) с кэшем на набор фильтров
+                                              (время жизни задаётся в сервисе count_cache_ttl)
+            :param return_representation      create и edit возвращают запись по read_schema, если False - create
+                                              только pk ({item: pk}), edit - 204. Заголовок запроса
+                                              Prefer: return=minimal/representation важнее этого параметра
+            :param precompiled_serializers    ответы собираются функциями из compile_serializer (один раз на схему)
+                                              и отдаются готовым json без from_orm и проверки по response_model.
+                                              Роуты с response_model_* в routes_kwargs всё равно идут через
+                                              from_orm и response_model, fields= у них не применяется
             :param auto_routes_dependencies   инъекции которые применяются для всех роутов, сгенерированных
                                               автоматически, если нужно для всех, не только автоматически
                                               сгенерированных, то нужно использовать dependencies
             :param routes_kwargs              словарь вида {route_name: add_api_route kwargs},
                                               значение может быть равно False, если этот роут не нужен ({create: False})
             :param add_tree_routes            добавляет методы для деревьев
+            :param add_export_route           добавляет GET /export - все записи по тем же фильтрам и сортировке,
+                                              что и get_all, потоком ndjson или csv (?format=csv)
+            :param add_bulk_routes            добавляет POST /many и PATCH /many - создание и редактирование
+                                              пачкой (create_many, edit_many)
+            :param export_batch_size          сколько записей export достаёт из бд за раз
             :param read_only                  создаёт только get методы
             :param routes_only                set из роутов, которые нужно создать
             :param complete_auto_routes       если нужно создать какие-то роуты, без Path параметров, которые просто так
@@ -78,6 +126,8 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
 
         self.max_items_get_many_routes = max_items_get_many
         self.max_items_delete_many_routes = max_items_delete_many
+        self.max_items_create_many_routes = max_items_create_many
+        self.max_items_edit_many_routes = max_items_edit_many
         self.read_only = read_only
 
         self.auto_routes_dependencies = auto_routes_dependencies or []
@@ -89,13 +139,22 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
             routes_names = self.default_routes_names()
             if add_tree_routes:
                 routes_names = *routes_names, *self.tree_route_names()
-        self.routes_names = routes_names
+            if add_export_route:
+                routes_names = *routes_names, *self.export_route_names()
+            if add_bulk_routes and not read_only:
+                routes_names = *routes_names, *self.bulk_route_names()
+        self.routes_names = self.order_routes_names(routes_names)
 
         if filters is None:
             filters = []
         self.filters = filters
         self.available_sort = available_sort or self.service.get_default_sort_fields()
         self.max_page_size = max_page_size
+        self.pagination = pagination
+        self.count_strategy = count_strategy
+        self.return_representation = return_representation
+        self.precompiled_serializers = precompiled_serializers
+        self.export_batch_size = export_batch_size
 
         if complete_auto_routes:
             self.complete_auto_routes()
@@ -108,27 +167,142 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
             self._register_route(route_name, (route_data if isinstance(route_data, dict) else {}))
 
     def _get_all_route(self) -> Callable[..., Any]:
+        if self.pagination == 'cursor':
+            return self._get_all_by_cursor_route()
         get_all = self.service.get_all
         list_item_schema = self.get_list_item_schema()
+        precompiled = self.use_precompiled_serializers('get_all')
+        sparse_fields = not self.has_response_model_kwargs('get_all')
+        serialize = self.get_serializer(list_item_schema, precompiled)
+        narrow_query = serializes_by_field(list_item_schema)
         filters = self.filters
+        count_strategy = self.count_strategy
 
         async def route(
                 background_tasks: BackgroundTasks,
                 request: Request,
                 response: Response,
                 pagination: PAGINATION = pagination_factory(self.max_page_size),
-                sort: set[str] = Depends(sort_factory(self.available_sort)),
-                applied_filters: list[BaseFilter] = Depends(get_filters(filters))
+                sort: list[str] = Depends(sort_factory(self.available_sort)),
+                applied_filters: list[BaseFilter] = Depends(get_filters(filters)),
+                fields: Optional[tuple[str, ...]] = Depends(fields_factory(list_item_schema)),
         ):
             raise_if_error_in_filters(applied_filters)
+            if not sparse_fields:
+                # fields= отдаётся мимо response_model, его response_model_* важнее
+                fields = None
             skip, limit = pagination
             result, total = await get_all(
                 skip, limit, sort, applied_filters,
                 background_tasks=background_tasks,
                 request=request,
+                count_strategy=count_strategy,
+                fields=fields if narrow_query else None,
+            )
+            headers = {'X-Total-Count': str(total)} if total is not None else None
+            if fields is not None:
+                return self.render_fields(response, list_item_schema, fields, result, headers=headers)
+            return self.render(response, [serialize(r) for r in result], headers=headers, precompiled=precompiled)
+
+        return route
+
+    def _get_all_by_cursor_route(self) -> Callable[..., Any]:
+        get_all_by_cursor = self.service.get_all_by_cursor
+        get_cursor_keys = self.service.get_cursor_keys
+        list_item_schema = self.get_list_item_schema()
+        precompiled = self.use_precompiled_serializers('get_all')
+        sparse_fields = not self.has_response_model_kwargs('get_all')
+        serialize = self.get_serializer(list_item_schema, precompiled)
+        narrow_query = serializes_by_field(list_item_schema)
+        filters = self.filters
+        count_strategy = self.count_strategy
+        secret = get_settings_obj().cursor_secret
+
+        async def route(
+                background_tasks: BackgroundTasks,
+                request: Request,
+                response: Response,
+                pagination: CURSOR_PAGINATION = cursor_pagination_factory(self.max_page_size),
+                sort: list[str] = Depends(sort_factory(self.available_sort)),
+                applied_filters: list[BaseFilter] = Depends(get_filters(filters)),
+                fields: Optional[tuple[str, ...]] = Depends(fields_factory(list_item_schema)),
+        ):
+            raise_if_error_in_filters(applied_filters)
+            if not sparse_fields:
+                fields = None
+            keys = check_cursor_sort(get_cursor_keys, sort)
+            raw_cursor, limit = pagination
+            cursor = None
+            if raw_cursor is not None:
+                try:
+                    cursor = Cursor.decode(raw_cursor, secret)
+                    if cursor.keys != keys:
+                        raise InvalidCursor('Cursor does not match sort')
+                except InvalidCursor as e:
+                    raise RequestValidationError([ErrorWrapper(e, loc=('query', 'cursor'))])
+            result, total, next_cursor, prev_cursor = await get_all_by_cursor(
+                cursor, limit, sort, applied_filters,
+                background_tasks=background_tasks,
+                request=request,
+                count_strategy=count_strategy,
+                fields=fields if narrow_query else None,
+            )
+            headers = {}
+            if total is not None:
+                headers['X-Total-Count'] = str(total)
+            if next_cursor is not None:
+                headers['X-Next-Cursor'] = next_cursor.encode(secret)
+            if prev_cursor is not None:
+                headers['X-Prev-Cursor'] = prev_cursor.encode(secret)
+            if fields is not None:
+                return self.render_fields(response, list_item_schema, fields, result, headers=headers)
+            return self.render(response, [serialize(r) for r in result], headers=headers, precompiled=precompiled)
+
+        return route
+
+    def _export_route(self) -> Callable[..., Any]:
+        export = self.service.export
+        get_cursor_keys = self.service.get_cursor_keys
+        list_item_schema = self.get_list_item_schema()
+        narrow_query = serializes_by_field(list_item_schema)
+        filters = self.filters
+        batch_size = self.export_batch_size
+        filename = self.prefix.strip('/')
+
+        async def route(
+                request: Request,
+                export_format: EXPORT_FORMAT = Query('ndjson', alias='format'),
+                sort: list[str] = Depends(sort_factory(self.available_sort)),
+                applied_filters: list[BaseFilter] = Depends(get_filters(filters)),
+                fields: Optional[tuple[str, ...]] = Depends(fields_factory(list_item_schema)),
+        ):
+            raise_if_error_in_filters(applied_filters)
+            # после начала потока статус уже не поменять, поэтому ошибку сортировки отдаём до него
+            check_cursor_sort(get_cursor_keys, sort)
+            # поток идёт мимо response_model, поэтому всегда compile_serializer
+            if fields is None:
+                serialize = compile_serializer(list_item_schema)
+            else:
+                serialize = sparse_serializer(list_item_schema, fields)
+            batches = export(
+                sort, applied_filters,
+                request=request,
+                fields=fields if narrow_query else None,
+                batch_size=batch_size,
+            )
+            if export_format == 'csv':
+                columns = [
+                    field.alias for name, field in list_item_schema.__fields__.items()
+                    if fields is None or name in fields
+                ]
+                content = csv_stream(batches, serialize, columns)
+            else:
+                content = ndjson_stream(batches, serialize)
+            return StreamingResponse(
+                content,
+                media_type=EXPORT_MEDIA_TYPES[export_format],
+                headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'},
             )
-            response.headers.append('X-Total-Count', str(total))
-            return [list_item_schema.from_orm(r) for r in result]
 
         return route
 
@@ -136,11 +310,13 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
         pk_field_type = self.service.pk_field_type
         max_items = self.max_items_get_many_routes
         get_many = self.service.get_many
-        read_schema = self.get_read_schema()
+        precompiled = self.use_precompiled_serializers('get_many')
+        serialize = self.get_serializer(self.get_read_schema(), precompiled)
 
         async def route(
                 request: Request,
                 background_tasks: BackgroundTasks,
+                response: Response,
                 item_ids: CommaSeparatedOf(pk_field_type, max_items=max_items, in_query=True) = Query(..., alias='ids')
         ):
             results = await get_many(
@@ -148,18 +324,20 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
                 background_tasks=background_tasks,
                 request=request,
             )
-            return [read_schema.from_orm(r) for r in results]
+            return self.render(response, [serialize(r) for r in results], precompiled=precompiled)
 
         return route
 
     def _get_one_route(self) -> Callable[..., Any]:
         pk_field_type = self.service.pk_field_type
         get_one = self.service.get_one
-        read_schema = self.get_read_schema()
+        precompiled = self.use_precompiled_serializers('get_one')
+        serialize = self.get_serializer(self.get_read_schema(), precompiled)
 
         async def route(
                 request: Request,
                 background_tasks: BackgroundTasks,
+                response: Response,
                 item_id: pk_field_type = Path(...),
         ):
             try:
@@ -170,75 +348,153 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
                 )
             except ItemNotFound:
                 raise self.not_found_error()
-            return read_schema.from_orm(item)
+            return self.render(response, serialize(item), precompiled=precompiled)
 
         return route
 
     def _get_tree_node_route(self) -> Callable[..., Any]:
         pk_field_type = self.service.pk_field_type
         get_tree_node = self.service.get_tree_node
-        get_list_item_schema = self.get_list_item_schema()
+        precompiled = self.use_precompiled_serializers('get_tree_node')
+        serialize = self.get_serializer(self.get_list_item_schema(), precompiled)
         alias = lower_camel(self.service.node_key)
 
         async def route(
                 request: Request,
                 background_tasks: BackgroundTasks,
+                response: Response,
                 node_id: Optional[pk_field_type] = Query(None, alias=alias)
         ):
-            return [get_list_item_schema.from_orm(item) for item in await get_tree_node(
+            return self.render(response, [serialize(item) for item in await get_tree_node(
                 node_id,
                 background_tasks=background_tasks,
                 request=request,
-            )]
+            )], precompiled=precompiled)
 
         return route
 
     def _create_route(self) -> Callable[..., Any]:
         create_schema = self.get_create_schema()
-        read_schema = self.get_read_schema()
+        precompiled = self.use_precompiled_serializers('create')
+        serialize = self.get_serializer(self.get_read_schema(), precompiled)
         create = self.service.create
+        pk_attr = self.service.pk_attr
 
         async def route(
                 request: Request,
                 background_tasks: BackgroundTasks,
+                response: Response,
                 data: create_schema = Body(...)
         ):
+            minimal = self.return_minimal(request)
             try:
                 instance = await create(
                     data,
                     background_tasks=background_tasks,
                     request=request,
+                    representation='minimal' if minimal else 'auto',
                 )
             except MultipleFieldsError as e:
                 raise self.field_errors(e)
-            return read_schema.from_orm(instance)
+            if minimal:
+                return self.json_response(
+                    response,
+                    self.ok_response(item=getattr(instance, pk_attr)),
+                    status_code=201,
+                    headers=MINIMAL_HEADERS,
+                )
+            return self.render(response, serialize(instance), status_code=201, precompiled=precompiled)
+
+        return route
+
+    def _create_many_route(self) -> Callable[..., Any]:
+        create_schema = self.get_create_schema()
+        max_items = self.max_items_create_many_routes
+        create_many = self.service.create_many
+
+        async def route(
+                request: Request,
+                background_tasks: BackgroundTasks,
+                items: conlist(create_schema, min_items=1, max_items=max_items) = Body(...)
+        ):
+            try:
+                created_items_count = await create_many(
+                    items,
+                    background_tasks=background_tasks,
+                    request=request,
+                )
+            except MultipleFieldsError as e:
+                raise self.field_errors(e)
+            return self.ok_response(count=created_items_count)
 
         return route
 
     def _edit_route(self) -> Callable[..., Any]:
         pk_field_type = self.service.pk_field_type
-        read_schema = self.get_read_schema()
+        precompiled = self.use_precompiled_serializers('edit')
+        serialize = self.get_serializer(self.get_read_schema(), precompiled)
         edit_schema = self.get_edit_schema()
         edit = self.service.edit
 
         async def route(
                 request: Request,
                 background_tasks: BackgroundTasks,
+                response: Response,
                 item_id: pk_field_type = Path(...),
                 data: edit_schema = Body(...)
         ):
+            minimal = self.return_minimal(request)
             try:
                 instance = await edit(
                     item_id,
                     data,
                     background_tasks=background_tasks,
                     request=request,
+                    representation='minimal' if minimal else 'auto',
                 )
             except ItemNotFound:
                 raise self.not_found_error()
             except MultipleFieldsError as e:
                 raise self.field_errors(e)
-            return read_schema.from_orm(instance)
+            if minimal:
+                return self.inherit_response(response, Response(status_code=204, headers=MINIMAL_HEADERS))
+            return self.render(response, serialize(instance), precompiled=precompiled)
+
+        return route
+
+    def _edit_many_route(self) -> Callable[..., Any]:
+        pk_field_type = self.service.pk_field_type
+        edit_schema = self.get_edit_schema()
+        max_items = self.max_items_edit_many_routes
+        edit_many = self.service.edit_many
+        # [{id, ...изменения}] или {ids: [...], data: {...изменения}}
+        item_schema = create_model(f'{edit_schema.__name__}ManyItem', __base__=edit_schema, id=(pk_field_type, ...))
+        shared_schema = create_model(
+            f'{edit_schema.__name__}Many',
+            __base__=CamelModel,
+            ids=(conlist(pk_field_type, min_items=1, max_items=max_items), ...),
+            data=(edit_schema, ...),
+        )
+
+        async def route(
+                request: Request,
+                background_tasks: BackgroundTasks,
+                data: conlist(item_schema, min_items=1, max_items=max_items) | shared_schema = Body(...)
+        ):
+            if isinstance(data, list):
+                item_ids, changes = [item.id for item in data], data
+            else:
+                item_ids, changes = data.ids, data.data
+            try:
+                edited_items_count = await edit_many(
+                    item_ids,
+                    changes,
+                    background_tasks=background_tasks,
+                    request=request,
+                )
+            except MultipleFieldsError as e:
+                raise self.field_errors(e)
+            return self.ok_response(count=edited_items_count)
 
         return route
 
@@ -282,6 +538,91 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
 
         return route
 
+    def has_response_model_kwargs(self, route_name: str) -> bool:
+        route_data = self.routes_kwargs.get(route_name)
+        return isinstance(route_data, dict) and any(key.startswith('response_model_') for key in route_data)
+
+    def use_precompiled_serializers(self, route_name: str) -> bool:
+        """response_model_* из routes_kwargs работают только через response_model, такие роуты - через from_orm"""
+        return self.precompiled_serializers and not self.has_response_model_kwargs(route_name)
+
+    def get_serializer(self, schema: Type[CamelModel], precompiled: bool = None) -> Callable[[Any], Any]:
+        if precompiled is None:
+            precompiled = self.precompiled_serializers
+        if precompiled:
+            return compile_serializer(schema)
+        # dict - строки get_all при read_mode='values'
+        return lambda obj: schema.parse_obj(obj) if type(obj) is dict else schema.from_orm(obj)
+
+    def render(
+            self,
+            response: Response,
+            content: Any,
+            *,
+            status_code: int = 200,
+            headers: dict[str, str] = None,
+            precompiled: bool = None,
+    ) -> Any:
+        """
+        precompiled (по умолчанию precompiled_serializers) - content уже готовые dict из compile_serializer,
+        сразу рендерятся в ответ без повторной проверки по response_model. Иначе content - схемы,
+        дальше как обычно у FastAPI
+        """
+        if precompiled is None:
+            precompiled = self.precompiled_serializers
+        if precompiled:
+            return self.json_response(response, content, status_code=status_code, headers=headers)
+        for key, value in (headers or {}).items():
+            response.headers.append(key, value)
+        return content
+
+    @classmethod
+    def render_fields(
+            cls,
+            response: Response,
+            schema: Type[CamelModel],
+            fields: Sequence[str],
+            items: list[Any],
+            *,
+            headers: dict[str, str] = None,
+    ) -> DefaultJSONResponse:
+        """Ответ на fields=: только эти ключи, response_model такое не пропустит, поэтому всегда готовым json"""
+        serialize = sparse_serializer(schema, fields)
+        return cls.json_response(response, [serialize(item) for item in items], headers=headers)
+
+    @classmethod
+    def json_response(
+            cls,
+            response: Response,
+            content: Any,
+            *,
+            status_code: int = 200,
+            headers: dict[str, str] = None,
+    ) -> DefaultJSONResponse:
+        """Готовый ответ вместо content, с заголовками, cookie и статусом из инъекции response"""
+        return cls.inherit_response(response, DefaultJSONResponse(content, status_code=status_code, headers=headers))
+
+    @staticmethod
+    def inherit_response(response: Response, result: RESPONSE) -> RESPONSE:
+        """
+        FastAPI переносит в ответ заголовки, cookie и статус из инъекции response только если роут вернул
+        не Response, поэтому для готовых ответов переносим их сами, как это делает FastAPI
+        """
+        if response.status_code:
+            result.status_code = response.status_code
+        result.raw_headers.extend(response.raw_headers)
+        return result
+
+    def return_minimal(self, request: Request) -> bool:
+        """Prefer: return=minimal / return=representation из запроса важнее return_representation роутера"""
+        for preference in request.headers.get('prefer', '').replace(';', ',').split(','):
+            match preference.strip().lower().replace(' ', ''):
+                case 'return=minimal':
+                    return True
+                case 'return=representation':
+                    return False
+        return not self.return_representation
+
     @classmethod
     def _ok_response_instance(cls) -> BaseCodes:
         return Codes.OK
@@ -319,8 +660,26 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
     def tree_route_names() -> tuple[str, ...]:
         return 'get_tree_node',
 
+    @staticmethod
+    def export_route_names() -> tuple[str, ...]:
+        return 'export',
+
+    @staticmethod
+    def bulk_route_names() -> tuple[str, ...]:
+        return 'create_many', 'edit_many'
+
+    @staticmethod
+    def order_routes_names(routes_names: Iterable[str]) -> tuple[str, ...]:
+        # PATCH и DELETE /{item_id} перекрывают /many, поэтому они регистрируются последними
+        return tuple(sorted(routes_names, key=lambda name: name in ('edit', 'delete_one')))
+
     def all_route_names(self) -> tuple[str, ...]:
-        return *self.default_routes_names(), *self.tree_route_names()
+        return (
+            *self.default_routes_names(),
+            *self.tree_route_names(),
+            *self.export_route_names(),
+            *self.bulk_route_names(),
+        )
 
     def _register_route(
             self,
@@ -339,6 +698,12 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
                 response_model = list[self.get_list_item_schema()]
                 check_perms_dependency = Depends(self.service.has_get_permissions())
                 openapi_extra = {'parameters': [f.query_openapi_desc() for f in self.filters]}
+            case 'export':
+                path = '/export'
+                method = ["GET"]
+                responses = {200: {'content': {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}}
+                check_perms_dependency = Depends(self.service.has_get_permissions())
+                openapi_extra = {'parameters': [f.query_openapi_desc() for f in self.filters]}
             case 'get_many':
                 path = '/many'
                 method = ["GET"]
@@ -362,6 +727,16 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
                 responses = Codes.responses(self.field_errors_response_example())
                 status = 201
                 check_perms_dependency = Depends(self.service.has_create_permissions())
+            case 'create_many':
+                path = '/many'
+                method = ["POST"]
+                # как и в delete_many, ответ только с количеством, bulk insert не возвращает записи
+                responses = Codes.responses(
+                    (self._ok_response_instance(), {'count': 30}),
+                    self.field_errors_response_example()
+                )
+                status = 201
+                check_perms_dependency = Depends(self.service.has_create_permissions())
             case 'edit':
                 path = '/{item_id}'
                 method = ["PATCH"]
@@ -371,6 +746,14 @@ class CRUDRouter(Generic[SERVICE], APIRouter):
                     self.field_errors_response_example()
                 )
                 check_perms_dependency = Depends(self.service.has_edit_permissions())
+            case 'edit_many':
+                path = '/many'
+                method = ["PATCH"]
+                responses = Codes.responses(
+                    (self._ok_response_instance(), {'count': 30}),
+                    self.field_errors_response_example()
+                )
+                check_perms_dependency = Depends(self.service.has_edit_permissions())
             case 'delete_many':
                 path = '/many'
                 method = ["DELETE"]
@@ -441,6 +824,16 @@ def raise_if_error_in_filters(filters: list[BaseFilter]) -> None:
         raise RequestValidationError(errors)
 
 
+def check_cursor_sort(
+        get_cursor_keys: Callable[[list[str]], tuple[CursorKey, ...]],
+        sort: list[str],
+) -> tuple[CursorKey, ...]:
+    try:
+        return get_cursor_keys(sort)
+    except ValueError as e:
+        raise RequestValidationError([ErrorWrapper(e, loc=('query', 'sort'))])
+
+
 available_api_route_kwargs = [
     'dependencies',
     'responses',
@@ -0,0 +1,76 @@
+import hashlib
+import hmac
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import Any, Literal, NamedTuple, Self
+
+CURSOR_DIRECTION = Literal['next', 'prev']
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorKey(NamedTuple):
+    """Поле сортировки курсора, descending - как у '-field' в sort"""
+    field: str
+    descending: bool = False
+
+    @classmethod
+    def parse(cls, name: str) -> Self:
+        if name.startswith('-'):
+            return cls(name[1:], True)
+        return cls(name)
+
+    def order_by(self, backward: bool = False) -> str:
+        # страница назад - тот же порядок наоборот
+        return f'-{self.field}' if self.descending != backward else self.field
+
+
+class Cursor(NamedTuple):
+    """
+    Позиция в выборке для keyset пагинации.
+    keys - поля сортировки (последним всегда идёт pk), values - их значения у граничной записи
+    """
+    direction: CURSOR_DIRECTION
+    keys: tuple[CursorKey, ...]
+    values: tuple[Any, ...]
+
+    def encode(self, secret: bytes) -> str:
+        payload = _b64encode(json.dumps(
+            [self.direction, self.keys, self.values],
+            default=str,
+            separators=(',', ':'),
+        ).encode())
+        return f'{payload}.{_b64encode(_sign(payload, secret))}'
+
+    @classmethod
+    def decode(cls, value: str, secret: bytes) -> Self:
+        payload, _, signature = value.partition('.')
+        try:
+            signature = urlsafe_b64decode(_pad(signature))
+        except ValueError:
+            raise InvalidCursor('Cursor is malformed')
+        if not hmac.compare_digest(signature, _sign(payload, secret)):
+            raise InvalidCursor('Cursor signature is invalid')
+        try:
+            direction, keys, values = json.loads(urlsafe_b64decode(_pad(payload)))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Cursor is malformed')
+        if direction not in ('next', 'prev') or len(keys) != len(values) or not all(
+            type(key) is list and len(key) == 2 and type(key[0]) is str and type(key[1]) is bool for key in keys
+        ):
+            raise InvalidCursor('Cursor is malformed')
+        return cls(direction, tuple(CursorKey(*key) for key in keys), tuple(values))
+
+
+def _sign(payload: str, secret: bytes) -> bytes:
+    return hmac.new(secret, payload.encode(), hashlib.sha256).digest()
+
+
+def _b64encode(value: bytes) -> str:
+    return urlsafe_b64encode(value).rstrip(b'=').decode()
+
+
+def _pad(value: str) -> str:
+    return value + '=' * (-len(value) % 4)
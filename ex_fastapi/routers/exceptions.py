@@ -25,6 +25,10 @@ class NotFoundFK(FieldsError):
     key = 'notFoundFK'
 
 
+class Required(FieldsError):
+    key = 'required'
+
+
 class MultipleFieldsError(Exception):
     errors: list[FieldsError]
 
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Callable
+from typing import Any, Literal
+
+from ex_fastapi.default_response import render_json
+
+EXPORT_FORMAT = Literal['ndjson', 'csv']
+EXPORT_MEDIA_TYPES: dict[EXPORT_FORMAT, str] = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+ROWS = AsyncIterator[list[Any]]
+
+
+async def ndjson_stream(batches: ROWS, serialize: Callable[[Any], dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Каждая запись - json на отдельной строке, одна пачка из сервиса - один кусок ответа"""
+    async for batch in batches:
+        yield b''.join(render_json(serialize(row)) + b'\n' for row in batch)
+
+
+async def csv_stream(
+        batches: ROWS,
+        serialize: Callable[[Any], dict[str, Any]],
+        columns: list[str],
+) -> AsyncIterator[bytes]:
+    """columns - alias полей схемы, первая строка - заголовок. Вложенные значения (списки, схемы) пишутся json"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in batches:
+        for row in batch:
+            data = serialize(row)
+            writer.writerow([csv_value(data[column]) for column in columns])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # пустая выборка - только заголовок
+        yield buffer.getvalue().encode('utf-8')
+
+
+def csv_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return value
+    # bool, UUID, datetime, Enum... как в json ответе, строки без кавычек
+    encoded = render_json(value).decode()
+    if encoded.startswith('"'):
+        return json.loads(encoded)
+    return encoded
@@ -1,13 +1,16 @@
 from typing import Optional, Any, Type, Callable
 
 from fastapi import Depends, Query, Request
-from pydantic import NonNegativeInt
+from fastapi.exceptions import RequestValidationError
+from pydantic import NonNegativeInt, BaseModel
+from pydantic.error_wrappers import ErrorWrapper
 
 from ex_fastapi import CommaSeparatedOf, snake_case
 from ex_fastapi.routers.filters import BaseFilter
 
 ROUTE = bool | dict[str, Any]
 PAGINATION = tuple[Optional[int], Optional[int]]
+CURSOR_PAGINATION = tuple[Optional[str], Optional[int]]
 
 
 def pagination_factory(max_limit: Optional[int], default_limit: Optional[int] = 50) -> Any:
@@ -27,6 +30,23 @@ def pagination_factory(max_limit: Optional[int], default_limit: Optional[int] =
     return Depends(pagination)
 
 
+def cursor_pagination_factory(max_limit: Optional[int], default_limit: Optional[int] = 50) -> Any:
+    """
+    Created the keyset pagination dependency, cursor is taken from X-Next-Cursor/X-Prev-Cursor of previous page
+    """
+
+    if max_limit and default_limit > max_limit:
+        default_limit = max_limit
+
+    def pagination(
+            cursor: Optional[str] = Query(None),
+            limit: Optional[int] = Query(default_limit, ge=1, le=max_limit)
+    ) -> CURSOR_PAGINATION:
+        return cursor, limit
+
+    return Depends(pagination)
+
+
 def get_filters(filters: list[Type[BaseFilter]]):
     def wrapper(request: Request) -> list[BaseFilter]:
         qp = request.query_params
@@ -34,17 +54,43 @@ def get_filters(filters: list[Type[BaseFilter]]):
     return wrapper
 
 
-def sort_factory(available: set[str]) -> Callable[[...], set[str]]:
+def sort_factory(available: set[str]) -> Callable[[...], list[str]]:
     def sort(fields: CommaSeparatedOf(str, wrapper=snake_case, in_query=True) = Query(
         None,
         alias='sort',
         description=f'Пиши,поля,через,запятую. Доступно: {", ".join(available)}'
-    )) -> set[str]:
-        result: set[str] = set()
+    )) -> list[str]:
+        # порядок полей важен, поэтому list, а не set
+        result: list[str] = []
         if fields:
             for field in fields:
-                if field in available:
-                    result.add(field)
+                if field in available and field not in result:
+                    result.append(field)
         return result
 
     return sort
+
+
+def fields_factory(schema: Type[BaseModel]) -> Callable[[...], Optional[tuple[str, ...]]]:
+    names = {}
+    for field in schema.__fields__.values():
+        names[field.name] = names[field.alias] = field.name
+    order = list(schema.__fields__)
+    aliases = [field.alias for field in schema.__fields__.values()]
+
+    def fields(value: CommaSeparatedOf(str, in_query=True) = Query(
+        None,
+        alias='fields',
+        description=f'Только эти поля в ответе, пиши,через,запятую. Доступно: {", ".join(aliases)}'
+    )) -> Optional[tuple[str, ...]]:
+        if not value:
+            return None
+        if unknown := [name for name in value if name not in names]:
+            raise RequestValidationError([ErrorWrapper(
+                ValueError(f'Unknown fields: {", ".join(unknown)}'), loc=('query', 'fields')
+            )])
+        requested = {names[name] for name in value}
+        # порядок ключей в ответе как в схеме
+        return tuple(name for name in order if name in requested)
+
+    return fields
@@ -1,9 +1,10 @@
 import os
+import hashlib
 from importlib import import_module
 from datetime import timedelta
 from enum import Enum
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 from pydantic import BaseSettings as PydanticBaseSettings, DirectoryPath, AnyHttpUrl
 
@@ -38,9 +39,14 @@ class BaseSettings(PydanticBaseSettings):
     COOKIE_SECURE: bool = False
     RSA_PRIVATE: str
     RSA_PUBLIC: str
+    # RSA_* - ключи для JWT_ALGORITHM, не обязательно RSA (ES256, EdDSA)
+    JWT_ALGORITHM: str = 'RS256'
+    JWT_KID: Optional[str] = None
+    JWT_PREVIOUS_KEYS: dict[str, str] = {}
     ACCESS_TOKEN_LIFETIME: int = 5
     REFRESH_TOKEN_LIFETIME: int = 10
     SITE: AnyHttpUrl = 'http://localhost:8000'
+    CURSOR_SECRET: Optional[str] = None
 
     class Config(SettingsConfig):
         pass
@@ -57,6 +63,13 @@ class BaseSettings(PydanticBaseSettings):
     def cookie_secure(self) -> bool:
         return self.SITE.scheme == 'https'
 
+    @property
+    def cursor_secret(self) -> bytes:
+        # курсоры пагинации подписываются, если отдельный секрет не задан - берём производный от RSA_PRIVATE
+        if self.CURSOR_SECRET:
+            return self.CURSOR_SECRET.encode()
+        return hashlib.sha256(self.RSA_PRIVATE.encode()).digest()
+
 
 def get_settings(var: str, default: Any = '__undefined__') -> Any:
     settings = import_module('settings')
@@ -21,6 +21,10 @@ setup(
         'PyJWT==2.6.0',
         'cryptography==39.0.2',
     ],
+    extras_require={
+        'argon2': ['argon2-cffi'],
+        'bcrypt': ['bcrypt'],
+    },
 
     python_requires='>=3.11',
 )